@@ -1,22 +1,58 @@
+import asyncio
 import base64
-from fastapi import APIRouter, HTTPException, Depends
+import hashlib
+import json
+from tempfile import SpooledTemporaryFile
+from datetime import date
+from decimal import Decimal
+from typing import AsyncIterator, Callable, Dict, List, Literal, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from ..models.schemas import (
     ImageParseRequest,
     TextParseRequest,
+    BatchParseRequest,
+    BatchParseItem,
     TransactionRequest,
     TransactionResponse,
+    BulkTransactionResult,
+    BulkTransactionResponse,
     BalanceResponse,
+    TransactionItem,
+    TransactionListResponse,
+    TransactionPosting,
+    StatsBucket,
+    MerchantTotal,
+    MonthDelta,
+    StatsResponse,
     ParseResponse
 )
 from ..models.auth import LoginRequest, Token
 from ..services.vlm_factory import get_vlm_service
-from ..services.beancount_ops import BeancountService
+from ..services.vlm_base import VLMUsageStats
+from ..services.beancount_ops import get_beancount_service
 from ..services.fava_service import FavaService
+from ..services.fava_cache import FavaResponseCache
+from ..services.parse_cache import ParseCache
+from ..services.image_preprocess import ImagePreprocessor
+from ..services.json_stream import IncrementalJSONObjectParser
+from ..services.text_rules import parse_text_locally
+from ..services.merchant_index import MerchantIndex, get_merchant_index
+from ..services.posting_index import TransactionQuery, decode_cursor, get_posting_index
+from ..services.spending_stats import StatsResult, format_bucket, get_spending_stats
+from ..services.account_index import AccountIndex
 from ..services.prompts import get_image_parse_prompt, get_text_parse_prompt
-from ..utils.auth import authenticate_user, create_access_token, verify_token
+from ..utils.http_cache import conditional_json_response, make_etag
+from ..utils.auth import TokenCache, authenticate_user, create_access_token, decode_token, verify_token
+from ..config import settings
 
 router = APIRouter(prefix="/api")
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 @router.post("/login", response_model=Token)
 async def login(request: LoginRequest):
     if not authenticate_user(request.username, request.password):
@@ -25,32 +61,352 @@ async def login(request: LoginRequest):
     access_token = create_access_token(data={"sub": request.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
+async def _parse_image_source(image, digest: str, original_bytes: int) -> ParseResponse:
+    """
+    解析一张图片（字节或文件对象），先查缓存，未命中时预处理后调用 VLM
+
+    Args:
+        image: 图片字节或可读文件对象
+        digest: 原始图片内容的哈希
+        original_bytes: 原始图片大小
+    """
+    vlm_service = get_vlm_service()
+    prompt = get_image_parse_prompt()
+
+    # 相同图片、prompt 和模型直接返回缓存结果
+    cache_key = ParseCache.make_key("image", digest, prompt, vlm_service.model_id)
+    cached = ParseCache.get(cache_key)
+    if cached is not None:
+        return await _apply_merchant_hints(ParseResponse(**cached, cached=True, source="cache"))
+
+    prepared = await ImagePreprocessor.prepare(image, original_bytes)
+    result = await vlm_service.parse_image(prepared.data, prompt, prepared.media_type)
+    print("result:", result)
+    response = ParseResponse(**result)
+    ParseCache.put(cache_key, response.model_dump(exclude={"cached", "source"}))
+    return await _apply_merchant_hints(response)
+
 @router.post("/parse/image", response_model=ParseResponse)
 async def parse_image(request: ImageParseRequest, username: str = Depends(verify_token)):
     try:
         image_data = base64.b64decode(request.image)
-        vlm_service = get_vlm_service()
-        result = await vlm_service.parse_image(image_data, get_image_parse_prompt())
-        print("result:", result)
-        return ParseResponse(**result)
+        return await _parse_image_source(image_data, ParseCache.digest_bytes(image_data), len(image_data))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to parse image: {str(e)}")
 
+async def _spool_upload(chunks) -> Tuple[SpooledTemporaryFile, str, int]:
+    """
+    把上传内容分块写入临时文件，同时计算哈希并限制大小，内存占用有上限
+
+    Returns:
+        (临时文件, 内容哈希, 字节数)
+    """
+    spool = SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_BYTES)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Image too large")
+            hasher.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, hasher.hexdigest(), size
+
+async def _limited_stream(request: Request, limit: int) -> AsyncIterator[bytes]:
+    """按块读取请求体，累计超过 limit 时立即中止，超限的内容不会被解析或落盘"""
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail="Upload too large")
+        yield chunk
+
+async def _digest_upload(upload: UploadFile) -> Tuple[str, int]:
+    """计算 multipart 解析时已暂存的文件的哈希和大小，读完后回到文件开头"""
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        hasher.update(chunk)
+    await upload.seek(0)
+    return hasher.hexdigest(), size
+
+@router.post("/parse/image/upload", response_model=List[BatchParseItem])
+async def parse_image_upload(request: Request, username: str = Depends(verify_token)):
+    """
+    以 multipart/form-data（可包含多张图片）或原始 image/* 请求体上传图片并解析
+    上传内容分块读取，无需 base64 编码；每张图片返回一个 BatchParseItem，顺序与上传顺序一致，单张失败不影响其他图片
+    """
+    content_type = request.headers.get("content-type", "")
+    multipart = content_type.startswith("multipart/form-data")
+    limit = settings.IMAGE_UPLOAD_MAX_REQUEST_BYTES if multipart else settings.IMAGE_UPLOAD_MAX_BYTES
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    spools = []
+    form = None
+    try:
+        if multipart:
+            try:
+                form = await MultiPartParser(
+                    request.headers, _limited_stream(request, limit), max_files=settings.IMAGE_UPLOAD_MAX_FILES
+                ).parse()
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=e.message)
+            uploads = [value for _, value in form.multi_items() if isinstance(value, UploadFile)]
+            if not uploads:
+                raise HTTPException(status_code=400, detail="No image uploaded")
+            # multipart 解析时文件已经暂存在 SpooledTemporaryFile 中，直接使用，不再复制
+            sources = [(upload.file, *await _digest_upload(upload)) for upload in uploads]
+        elif content_type.startswith("image/"):
+            spools.append(await _spool_upload(request.stream()))
+            sources = spools
+        else:
+            raise HTTPException(status_code=415, detail="Expected multipart/form-data or image/* body")
+
+        # 与 /parse/batch 相同，限制同时进行的 VLM 请求数
+        semaphore = asyncio.Semaphore(settings.VLM_BATCH_CONCURRENCY)
+
+        async def run(index: int, image, digest: str, size: int) -> BatchParseItem:
+            try:
+                if size > settings.IMAGE_UPLOAD_MAX_BYTES:
+                    raise ValueError("Image too large")
+                async with semaphore:
+                    result = await _parse_image_source(image, digest, size)
+                return BatchParseItem(kind="image", index=index, success=True, result=result)
+            except Exception as e:
+                return BatchParseItem(kind="image", index=index, success=False, error=str(e))
+
+        return await asyncio.gather(*(run(i, *source) for i, source in enumerate(sources)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to parse image: {str(e)}")
+    finally:
+        for spool, _, _ in spools:
+            spool.close()
+        if form is not None:
+            await form.close()
+
+async def _refreshed_indexes() -> Optional[Tuple[MerchantIndex, AccountIndex]]:
+    """同步商家索引和账户索引到当前账本，账本不可用时返回 None"""
+    index = get_merchant_index()
+    try:
+        await index.arefresh()
+        # 商家提示需要把账户映射回分类，账户索引同样在线程池中刷新
+        return index, await get_beancount_service().aaccount_index()
+    except Exception as e:
+        print(f"Merchant index unavailable: {e}")
+        return None
+
+def _merchant_fields(index: MerchantIndex, accounts: AccountIndex,
+                     merchant: str) -> Optional[Tuple[Dict[str, str], float]]:
+    """查询商家历史，返回 (分类及支付方式字段, 分类置信度)"""
+    match = index.lookup(merchant)
+    if match is None:
+        return None
+    fields = accounts.describe(category_account=match.category_account)
+    if match.payment_confidence >= settings.MERCHANT_MIN_CONFIDENCE:
+        fields.update(accounts.describe(payment_account=match.payment_account))
+    return fields, match.category_confidence
+
+async def _apply_merchant_hints(response: ParseResponse) -> ParseResponse:
+    """
+    用历史账本中该商家最常用的分类覆盖模型给出的分类
+    支付方式以截图或文本为准，只在模型未识别出时补全
+    """
+    indexes = await _refreshed_indexes()
+    hint = _merchant_fields(*indexes, response.merchant) if indexes else None
+    if hint is None:
+        return response
+    fields, _ = hint
+    updates = {key: fields[key] for key in ("category", "transaction_type") if key in fields}
+    if not response.payment_method and "payment_method" in fields:
+        updates.update({key: fields[key] for key in ("payment_method", "bank_name", "card_last_four") if key in fields})
+    return response.model_copy(update=updates)
+
+async def _parse_text_by_rules(text: str) -> Optional[ParseResponse]:
+    """本地规则解析（含商家历史），置信度足够时直接返回结果"""
+    indexes = await _refreshed_indexes()
+    if indexes is None:
+        return None
+    lookup = lambda merchant: _merchant_fields(*indexes, merchant)
+    result, confidence = parse_text_locally(text, lookup, indexes[1])
+    if result is None or confidence < settings.TEXT_RULE_MIN_CONFIDENCE:
+        return None
+    return ParseResponse(**result, source="rule")
+
+async def _parse_text_source(text: str) -> ParseResponse:
+    """解析一段记账文本，依次尝试本地规则、缓存，最后调用 VLM"""
+    local = await _parse_text_by_rules(text)
+    if local is not None:
+        return local
+
+    vlm_service = get_vlm_service()
+    prompt = get_text_parse_prompt()
+
+    cache_key = ParseCache.make_key("text", ParseCache.digest_text(text), prompt, vlm_service.model_id)
+    cached = ParseCache.get(cache_key)
+    if cached is not None:
+        return await _apply_merchant_hints(ParseResponse(**cached, cached=True, source="cache"))
+
+    result = await vlm_service.parse_text(text, prompt)
+    print("result:", result)
+    response = ParseResponse(**result)
+    ParseCache.put(cache_key, response.model_dump(exclude={"cached", "source"}))
+    return await _apply_merchant_hints(response)
+
 @router.post("/parse/text", response_model=ParseResponse)
 async def parse_text(request: TextParseRequest, username: str = Depends(verify_token)):
     try:
-        vlm_service = get_vlm_service()
-        result = await vlm_service.parse_text(request.text, get_text_parse_prompt())
-        print("result:", result)
-        return ParseResponse(**result)
+        return await _parse_text_source(request.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to parse text: {str(e)}")
 
+@router.post("/parse/batch")
+async def parse_batch(request: BatchParseRequest, username: str = Depends(verify_token)):
+    """
+    批量解析图片和文本
+    以有限并发调用 VLM，每完成一项即以 NDJSON 输出一行 BatchParseItem，单项失败不影响其他项；
+    图片和文本总数超过 VLM_BATCH_MAX_ITEMS 时返回 422
+    """
+    total = len(request.images) + len(request.texts)
+    if total > settings.VLM_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many items in batch: {total} > {settings.VLM_BATCH_MAX_ITEMS}"
+        )
+    semaphore = asyncio.Semaphore(settings.VLM_BATCH_CONCURRENCY)
+
+    async def run(kind: str, index: int, payload: str) -> BatchParseItem:
+        async with semaphore:
+            try:
+                if kind == "image":
+                    image_data = base64.b64decode(payload)
+                    result = await _parse_image_source(image_data, ParseCache.digest_bytes(image_data), len(image_data))
+                else:
+                    result = await _parse_text_source(payload)
+                return BatchParseItem(kind=kind, index=index, success=True, result=result)
+            except Exception as e:
+                return BatchParseItem(kind=kind, index=index, success=False, error=str(e))
+
+    tasks = [asyncio.ensure_future(run("image", i, image)) for i, image in enumerate(request.images)]
+    tasks += [asyncio.ensure_future(run("text", i, text)) for i, text in enumerate(request.texts)]
+
+    async def stream():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                item = await finished
+                yield item.model_dump_json() + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的解析
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _local_parse_events(response: ParseResponse) -> AsyncIterator[str]:
+    for name, value in response.model_dump().items():
+        yield _sse("field", {"name": name, "value": value})
+    yield _sse("result", response.model_dump())
+
+async def _stream_parse_events(cache_key: str, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    把模型的流式输出转换为 SSE 事件
+    每个 ParseResponse 字段一完成即推送 field 事件，最后推送完整的 result 事件，出错时推送 error 事件
+    """
+    try:
+        cached = ParseCache.get(cache_key)
+        if cached is not None:
+            response = await _apply_merchant_hints(ParseResponse(**cached, cached=True, source="cache"))
+            async for event in _local_parse_events(response):
+                yield event
+            return
+
+        parser = IncrementalJSONObjectParser()
+        async for delta in deltas:
+            for name, value in parser.feed(delta):
+                if name in ParseResponse.model_fields:
+                    yield _sse("field", {"name": name, "value": value})
+            if parser.done:
+                break
+        if not parser.done:
+            raise ValueError("Incomplete JSON in model output")
+
+        response = ParseResponse(**parser.result)
+        ParseCache.put(cache_key, response.model_dump(exclude={"cached", "source"}))
+        # 商家历史修正过的字段再推送一次
+        hinted = await _apply_merchant_hints(response)
+        for name in ("category", "transaction_type", "payment_method", "bank_name", "card_last_four"):
+            if getattr(hinted, name) != getattr(response, name):
+                yield _sse("field", {"name": name, "value": getattr(hinted, name)})
+        yield _sse("result", hinted.model_dump())
+    except Exception as e:
+        yield _sse("error", {"detail": f"Failed to parse: {str(e)}"})
+        return
+
+    # 结果已推送；继续读完模型输出，provider 在流结束时才拿到 usage 并记录用量
+    try:
+        async for _ in deltas:
+            pass
+    except Exception as e:
+        print(f"Error draining model stream: {e}")
+
+def _sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # 禁止 nginx 缓冲，保证每个事件立即送达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/parse/image/stream")
+async def parse_image_stream(request: ImageParseRequest, username: str = Depends(verify_token)):
+    """流式解析图片，通过 SSE 逐字段推送解析结果"""
+    try:
+        image_data = base64.b64decode(request.image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    vlm_service = get_vlm_service()
+    prompt = get_image_parse_prompt()
+    cache_key = ParseCache.make_key("image", ParseCache.digest_bytes(image_data), prompt, vlm_service.model_id)
+
+    async def deltas():
+        prepared = await ImagePreprocessor.prepare(image_data)
+        async for delta in vlm_service.stream_image(prepared.data, prompt, prepared.media_type):
+            yield delta
+
+    return _sse_response(_stream_parse_events(cache_key, deltas()))
+
+@router.post("/parse/text/stream")
+async def parse_text_stream(request: TextParseRequest, username: str = Depends(verify_token)):
+    """流式解析文本，通过 SSE 逐字段推送解析结果"""
+    local = await _parse_text_by_rules(request.text)
+    if local is not None:
+        return _sse_response(_local_parse_events(local))
+
+    vlm_service = get_vlm_service()
+    prompt = get_text_parse_prompt()
+    cache_key = ParseCache.make_key("text", ParseCache.digest_text(request.text), prompt, vlm_service.model_id)
+    return _sse_response(_stream_parse_events(cache_key, vlm_service.stream_text(request.text, prompt)))
+
 @router.post("/transaction", response_model=TransactionResponse)
 async def save_transaction(request: TransactionRequest, username: str = Depends(verify_token)):
     try:
-        beancount_service = BeancountService()
-        success = beancount_service.append_transaction(
+        beancount_service = get_beancount_service()
+        success = await beancount_service.append_transaction_async(
             date=request.date,
             amount=request.amount,
             merchant=request.merchant,
@@ -68,37 +424,264 @@ async def save_transaction(request: TransactionRequest, username: str = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save transaction: {str(e)}")
 
+@router.post("/transactions", response_model=BulkTransactionResponse)
+async def save_transactions(requests: List[TransactionRequest], username: str = Depends(verify_token)):
+    """
+    批量保存交易
+    所有条目先校验并生成记录，有效条目通过一次追加写入，逐条返回结果
+    """
+    try:
+        beancount_service = get_beancount_service()
+        items = [request.model_dump() for request in requests]
+        index = await beancount_service.aaccount_index()
+        built = await run_in_threadpool(beancount_service.build_transactions, items, index)
+
+        valid = [item for item in built if not isinstance(item, Exception)]
+        await beancount_service.append_transactions_async(valid)
+
+        results = [
+            BulkTransactionResult(index=i, success=False, message=f"Invalid transaction: {item}")
+            if isinstance(item, Exception)
+            else BulkTransactionResult(index=i, success=True, message="Transaction saved successfully")
+            for i, item in enumerate(built)
+        ]
+        return BulkTransactionResponse(
+            success=len(valid) == len(built),
+            saved=len(valid),
+            failed=len(built) - len(valid),
+            results=results
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save transactions: {str(e)}")
+
+@router.get("/transactions", response_model=TransactionListResponse)
+async def list_transactions(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    account: Optional[str] = None,
+    payee: Optional[str] = None,
+    min_amount: Optional[Decimal] = None,
+    max_amount: Optional[Decimal] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    username: str = Depends(verify_token)
+):
+    """
+    查询交易，按日期从新到旧分页返回
+    account 按账户前缀匹配，payee 按子串匹配（为空时匹配 narration），金额范围按分录金额绝对值匹配；
+    翻页时把上一页的 next_cursor 作为 cursor 传入
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        index = get_posting_index()
+        # 索引随账本版本维护，只有账本被外部修改时才在线程池中重建
+        await index.arefresh()
+        results, next_cursor = index.search(TransactionQuery(
+            start=start,
+            end=end,
+            account=account.rstrip(":") if account else None,
+            payee=payee,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            cursor=cursor,
+            limit=limit,
+        ))
+        items = [
+            TransactionItem(
+                id=item_id,
+                date=entry.date.isoformat(),
+                flag=entry.flag,
+                payee=entry.payee or "",
+                narration=entry.narration or "",
+                tags=sorted(entry.tags or ()),
+                postings=[
+                    TransactionPosting(
+                        account=posting.account,
+                        amount=float(posting.units.number) if posting.units and posting.units.number is not None else None,
+                        currency=posting.units.currency if posting.units else None,
+                    )
+                    for posting in entry.postings
+                ],
+            )
+            for item_id, entry in results
+        ]
+        return TransactionListResponse(items=items, next_cursor=next_cursor, ledger_version=index.version)
+    except ValueError as e:
+        # 游标指向的交易已被外部修改或删除
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list transactions: {str(e)}")
+
+def _relabel(cells: Dict[str, float], label: Callable[[str], str]) -> Dict[str, float]:
+    """把按账户汇总的金额按显示名称合并"""
+    merged: Dict[str, float] = {}
+    for name, total in cells.items():
+        key = label(name)
+        merged[key] = merged.get(key, 0.0) + total
+    return {key: round(total, 2) for key, total in sorted(merged.items(), key=lambda item: -item[1])}
+
+def _stats_response(result: StatsResult, index: AccountIndex, transaction_type: str,
+                    granularity: str) -> StatsResponse:
+    def category(account: str) -> str:
+        return index.describe(category_account=account).get("category") or account
+
+    def payment_method(account: str) -> str:
+        return index.describe(payment_account=account).get("payment_method") or account or "其他"
+
+    def breakdown(cells: Dict[str, Dict[str, float]]) -> dict:
+        accounts = cells.get("account", {})
+        return {
+            "by_category": _relabel(accounts, category),
+            "by_account": _relabel(accounts, lambda account: account),
+            "by_payment_method": _relabel(cells.get("payment", {}), payment_method),
+        }
+
+    buckets = [
+        StatsBucket(
+            period=format_bucket(bucket, granularity),
+            total=round(sum(cells.get("account", {}).values()), 2),
+            **breakdown(cells)
+        )
+        for bucket, cells in result.buckets.items()
+    ]
+
+    # 环比：区间内的每个月依次与上月比较，没有发生额的月份按 0 计
+    month_over_month = []
+    if result.months:
+        previous = None
+        for month in range(min(result.months), max(result.months) + 1):
+            total = result.months.get(month, 0.0)
+            delta = None if previous is None else total - previous
+            month_over_month.append(MonthDelta(
+                month=format_bucket(month, "month"),
+                total=round(total, 2),
+                delta=None if delta is None else round(delta, 2),
+                change=round(delta / previous, 4) if delta is not None and previous else None,
+            ))
+            previous = total
+
+    return StatsResponse(
+        transaction_type=transaction_type,
+        granularity=granularity,
+        total=round(result.total, 2),
+        buckets=buckets,
+        top_merchants=[
+            MerchantTotal(merchant=name, total=round(total, 2), count=count)
+            for name, total, count in result.merchants
+        ],
+        month_over_month=month_over_month,
+        **breakdown(result.totals)
+    )
+
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: Literal["day", "week", "month"] = "month",
+    transaction_type: Literal["expense", "income"] = "expense",
+    top: int = Query(10, ge=1, le=100),
+    username: str = Depends(verify_token)
+):
+    """
+    收支统计：按日/周/月分桶的分类、账户、支付方式合计，商家排行和逐月环比
+    只统计 CNY 分录；整月范围的按月统计直接读取物化的月汇总
+    """
+    try:
+        beancount_service = get_beancount_service()
+        snapshot = await beancount_service.aget_snapshot()
+        index = await beancount_service.aaccount_index()
+        stats = get_spending_stats()
+        await stats.arefresh()
+        etag = make_etag(
+            "stats", snapshot.fingerprint, index.config_digest,
+            start, end, granularity, transaction_type, top
+        )
+        return conditional_json_response(
+            request,
+            etag,
+            lambda: _stats_response(
+                stats.query(transaction_type, granularity, start, end, top),
+                index, transaction_type, granularity
+            )
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
+
 @router.get("/balance", response_model=BalanceResponse)
-async def get_balance(username: str = Depends(verify_token)):
+async def get_balance(
+    request: Request,
+    as_of: Optional[date] = None,
+    convert: Optional[str] = None,
+    username: str = Depends(verify_token)
+):
+    """
+    获取账户余额
+    as_of 为截至日期（含当天），不传为全部；holdings 包含所有币种。
+    不传 convert 时 balances 只含 CNY，传入时用账本中不晚于 as_of 的价格把各币种换算为该币种后合计
+    """
+    currency = convert.upper() if convert else "CNY"
     try:
-        beancount_service = BeancountService()
-        balances = beancount_service.get_balances()
-        return BalanceResponse(balances=balances)
+        beancount_service = get_beancount_service()
+        index = await beancount_service.abalance_index()
+        holdings, balances, unconverted = index.query(as_of, currency, convert=bool(convert))
+        response = BalanceResponse(
+            balances={account: float(number) for account, number in balances.items()},
+            ledger_version=index.version,
+            as_of=as_of.isoformat() if as_of else None,
+            currency=currency,
+            holdings={
+                account: {unit: float(number) for unit, number in positions.items()}
+                for account, positions in holdings.items()
+            },
+            unconverted={
+                account: {unit: float(number) for unit, number in positions.items()}
+                for account, positions in unconverted.items()
+            },
+        )
+        # ETag 由响应内容本身生成，与响应体一定对应，且对所有 worker 一致；
+        # 进程内的版本号不参与，查询只需一次二分查找，先生成内容代价很小
+        etag = make_etag("balance", response.model_dump_json(exclude={"ledger_version"}))
+        return conditional_json_response(request, etag, lambda: response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get balance: {str(e)}")
 
 @router.get("/accounts")
-async def get_accounts(username: str = Depends(verify_token)):
+async def get_accounts(request: Request, username: str = Depends(verify_token)):
     try:
-        beancount_service = BeancountService()
-        accounts = beancount_service.get_accounts()
-        return {"accounts": accounts}
+        beancount_service = get_beancount_service()
+        snapshot = await beancount_service.aget_snapshot()
+        # 响应体只包含由账本内容决定的字段，与基于文件指纹的 ETag 在各 worker 间一致
+        return conditional_json_response(
+            request,
+            make_etag("accounts", snapshot.fingerprint),
+            lambda: {"accounts": beancount_service.get_accounts(snapshot)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get accounts: {str(e)}")
 
 @router.get("/config/accounts")
-async def get_account_config(username: str = Depends(verify_token)):
+async def get_account_config(request: Request, username: str = Depends(verify_token)):
     """
     获取账户配置，包括支付方式、分类等
     前端使用此配置来动态生成选项，确保与 accounts.beancount 严格对应
     """
     try:
-        beancount_service = BeancountService()
-        config = beancount_service.get_account_config()
-        return config
+        beancount_service = get_beancount_service()
+        index = await beancount_service.aaccount_index()
+        return conditional_json_response(request, make_etag("config", index.config_digest), lambda: index.config)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get account config: {str(e)}")
 
+@router.get("/vlm/usage")
+async def get_vlm_usage(username: str = Depends(verify_token)):
+    """获取 VLM 调用的 token 用量及提供商缓存命中情况"""
+    return VLMUsageStats.summary()
+
 @router.post("/fava/start")
 async def start_fava(port: int = 5000, username: str = Depends(verify_token)):
     """启动Fava服务"""
@@ -117,11 +700,11 @@ async def start_fava(port: int = 5000, username: str = Depends(verify_token)):
 
 @router.post("/fava/stop")
 async def stop_fava(username: str = Depends(verify_token)):
-    """停止Fava服务"""
+    """停止Fava服务，对所有 worker 生效，直到再次调用 /fava/start"""
     try:
         success = FavaService.stop()
         if success:
-            return {"success": True, "message": "Fava stopped successfully"}
+            return {"success": True, "message": "Fava stopped on all workers"}
         else:
             raise HTTPException(status_code=500, detail="Failed to stop Fava")
     except Exception as e:
@@ -131,16 +714,35 @@ async def stop_fava(username: str = Depends(verify_token)):
 async def get_fava_status(username: str = Depends(verify_token)):
     """获取Fava服务状态"""
     try:
-        is_running = FavaService.is_running()
+        status = FavaService.status()
         return {
-            "running": is_running,
-            "port": 5000 if is_running else None
+            **status,
+            "port": 5000 if status["running"] else None,
+            "cache": FavaResponseCache.stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get Fava status: {str(e)}")
 
-@router.get("/auth/verify")
-async def verify_auth(username: str = Depends(verify_token)):
-    """验证token，供nginx auth_request使用"""
-    return {"status": "ok"}
+async def verify_auth(request: Request) -> Response:
+    """
+    验证token，供nginx auth_request使用
+
+    每个被代理的请求都会调用，直接注册为 Starlette 路由，不经过依赖注入和响应模型。
+    支持 Authorization: Bearer 头或 fava_token cookie。
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        token = authorization[7:]
+    else:
+        token = request.cookies.get("fava_token")
+    if decode_token(token) is None:
+        return Response(b'{"detail":"Invalid token"}', status_code=401, media_type="application/json")
+    return Response(b'{"status":"ok"}', media_type="application/json")
+
+router.add_route(f"{router.prefix}/auth/verify", verify_auth, methods=["GET"])
+
+@router.get("/auth/stats")
+async def get_auth_stats(username: str = Depends(verify_token)):
+    """获取 token 验证缓存的命中情况"""
+    return TokenCache.stats()
 
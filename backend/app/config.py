@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 from typing import Literal
 
@@ -8,11 +9,46 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-4o"
     OPENAI_BASE_URL: str | None = None
     CLAUDE_MODEL: str = "claude-opus-4-5-20251101"
+    # VLM 请求超时（秒）及共享连接池配置
+    VLM_TIMEOUT: float = 60.0
+    VLM_MAX_CONNECTIONS: int = 20
+    VLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    VLM_KEEPALIVE_EXPIRY: float = 60.0
+    # 批量解析时同时进行的 VLM 请求数，以及单次请求最多包含的图片和文本总数
+    VLM_BATCH_CONCURRENCY: int = 4
+    VLM_BATCH_MAX_ITEMS: int = 20
+    # 解析结果缓存：内存条目数、有效期（秒）、可选的落盘目录、清理落盘目录中过期文件的间隔（秒）
+    PARSE_CACHE_SIZE: int = 512
+    PARSE_CACHE_TTL: int = 7 * 24 * 3600
+    PARSE_CACHE_DIR: str | None = None
+    PARSE_CACHE_SWEEP_INTERVAL: int = 3600
+    # 本地规则解析置信度不低于该值时不再调用 VLM
+    TEXT_RULE_MIN_CONFIDENCE: float = 0.9
+    # 商家历史：至少出现的次数、最常用账户占比不低于该值时才用于修正分类和支付方式
+    MERCHANT_MIN_COUNT: int = 3
+    MERCHANT_MIN_CONFIDENCE: float = 0.8
+    # 图片预处理：最大边长、JPEG 质量、边缘裁剪阈值、线程池大小、裁剪缩放后尺寸不变且不超过该字节数时不重新压缩
+    IMAGE_MAX_SIDE: int = 1568
+    IMAGE_JPEG_QUALITY: int = 85
+    IMAGE_CROP_THRESHOLD: int = 16
+    IMAGE_WORKER_THREADS: int = 2
+    IMAGE_KEEP_ORIGINAL_MAX_BYTES: int = 1024 * 1024
+    # 图片上传：单张最大字节数、单次请求体最大字节数、单次最多图片数、超过该大小后落盘暂存
+    IMAGE_UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    IMAGE_UPLOAD_MAX_REQUEST_BYTES: int = 64 * 1024 * 1024
+    IMAGE_UPLOAD_MAX_FILES: int = 20
+    IMAGE_UPLOAD_SPOOL_BYTES: int = 1024 * 1024
+    
+    # 超过该字节数的 JSON 响应按 Accept-Encoding 压缩（gzip，安装 brotli 后优先 br）
+    HTTP_COMPRESS_MIN_BYTES: int = 1024
     
     # 认证配置
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30 * 24 * 60  # 30天
+    # 已验证 token 缓存的条目数及最长缓存时间（秒）
+    AUTH_TOKEN_CACHE_SIZE: int = 1024
+    AUTH_TOKEN_CACHE_TTL: int = 300
     
     # 简单用户配置
     ADMIN_USERNAME: str = "admin"
@@ -22,6 +58,27 @@ class Settings(BaseSettings):
     BEANCOUNT_MAIN_PATH: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "main.beancount")
     # 交易文件路径（用于写入新交易）
     BEANCOUNT_TRANSACTION_PATH: str = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "2026", "transactions.beancount")
+    # 账本解析线程池大小
+    LEDGER_WORKER_THREADS: int = 2
+    # 交易写入合并窗口（毫秒）及单批最大交易数
+    LEDGER_WRITE_WINDOW_MS: int = 5
+    LEDGER_WRITE_MAX_BATCH: int = 1000
+
+    # Fava 运行方式：process 为独立进程加反向代理，wsgi 为挂载到本应用内
+    FAVA_MODE: Literal["process", "wsgi"] = "process"
+    # Fava 进程就绪探测的超时时间、自动重启的最大退避时间（秒）
+    FAVA_READY_TIMEOUT: float = 60.0
+    FAVA_RESTART_MAX_BACKOFF: float = 60.0
+    # 多 worker 时用于选出唯一 Fava 进程所有者的锁文件，以及其他 worker 探测 Fava 的间隔（秒）
+    FAVA_LOCK_PATH: str = os.path.join(tempfile.gettempdir(), "beancount-agent-fava.lock")
+    FAVA_FOLLOWER_POLL_INTERVAL: float = 2.0
+    # Fava 代理：请求超时（秒）及连接池大小
+    FAVA_PROXY_TIMEOUT: float = 30.0
+    FAVA_PROXY_MAX_CONNECTIONS: int = 20
+    # Fava 响应缓存：总字节数上限、单个响应上限、带版本号静态资源的浏览器缓存时间（秒）
+    FAVA_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    FAVA_CACHE_MAX_ITEM_BYTES: int = 4 * 1024 * 1024
+    FAVA_STATIC_MAX_AGE: int = 365 * 24 * 3600
 
     class Config:
         env_file = ".env"
@@ -1,22 +1,32 @@
 from fastapi import FastAPI, Request, HTTPException, Cookie
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse
 from contextlib import asynccontextmanager
-import httpx
-from jose import JWTError, jwt
 from .api.routes import router
 from .config import settings
 from .services.fava_service import FavaService
+from .services.fava_proxy import FavaProxy
+from .services.ledger_cache import LedgerCache
+from .services.ledger_writer import LedgerWriter
+from .services.vlm_factory import VLMProviderRegistry
+from .utils.auth import decode_token
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时：启动Fava服务
     print("Starting Fava service...")
     FavaService.start(port=5000)
+    FavaProxy.startup()
+    LedgerWriter.start()
+    VLMProviderRegistry.startup()
     yield
     # 关闭时：停止Fava服务
     print("Stopping Fava service...")
-    FavaService.stop()
+    FavaService.shutdown()
+    await FavaProxy.shutdown()
+    await LedgerWriter.stop()
+    await VLMProviderRegistry.shutdown()
+    LedgerCache.shutdown()
 
 app = FastAPI(
     title="Beancount Accounting Agent API",
@@ -48,16 +58,9 @@ async def health():
     return {"status": "healthy"}
 
 def verify_fava_token(token: str) -> bool:
-    """验证 Fava 访问 token"""
-    if not token:
-        return False
-    try:
-        jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return True
-    except JWTError:
-        return False
+    """验证 Fava 访问 token，每个静态资源请求都会调用，结果经 TokenCache 缓存"""
+    return decode_token(token) is not None
 
-@app.api_route("/fava/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def fava_proxy_auth(path: str, request: Request, fava_token: str = Cookie(None)):
     """带认证的 Fava 代理"""
     # 验证 token
@@ -66,27 +69,28 @@ async def fava_proxy_auth(path: str, request: Request, fava_token: str = Cookie(
         return RedirectResponse(url="/login?redirect=/fava/", status_code=302)
     
     if not FavaService.is_running():
-        raise HTTPException(status_code=503, detail="Fava service is not running")
+        # 启动中或正在重启
+        raise HTTPException(status_code=503, detail="Fava service is not running", headers={"Retry-After": "1"})
     
-    fava_url = f"http://localhost:5000/fava/{path}"
-    if request.query_params:
-        fava_url += f"?{request.query_params}"
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        headers = {k: v for k, v in request.headers.items() if k.lower() not in ["host", "cookie"]}
-        
-        response = await client.request(
-            method=request.method,
-            url=fava_url,
-            headers=headers,
-            content=await request.body(),
-        )
-        
-        excluded_headers = ["content-encoding", "transfer-encoding", "content-length"]
-        resp_headers = {k: v for k, v in response.headers.items() if k.lower() not in excluded_headers}
-        
-        return StreamingResponse(
-            iter([response.content]),
-            status_code=response.status_code,
-            headers=resp_headers,
-        )
+    return await FavaProxy.forward(request, path)
+
+class FavaWSGIMount:
+    """进程内 Fava：校验 cookie 后直接交给 Fava 的 WSGI 应用，无需经过本地 HTTP 代理"""
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        if not verify_fava_token(request.cookies.get("fava_token")):
+            response = RedirectResponse(url="/login?redirect=/fava/", status_code=302)
+        elif not FavaService.is_running():
+            response = JSONResponse({"detail": "Fava service is not running"}, status_code=503)
+        else:
+            from starlette.middleware.wsgi import WSGIMiddleware
+            response = WSGIMiddleware(FavaService.get_wsgi_app().wsgi_app)
+        await response(scope, receive, send)
+
+if settings.FAVA_MODE == "wsgi":
+    app.mount("/fava", FavaWSGIMount())
+else:
+    app.add_api_route(
+        "/fava/{path:path}", fava_proxy_auth, methods=["GET", "POST", "PUT", "DELETE", "PATCH"]
+    )
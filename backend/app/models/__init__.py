@@ -1,17 +1,39 @@
 from .schemas import (
     ImageParseRequest,
     TextParseRequest,
+    BatchParseRequest,
+    BatchParseItem,
     TransactionRequest,
     TransactionResponse,
+    BulkTransactionResult,
+    BulkTransactionResponse,
     BalanceResponse,
+    TransactionPosting,
+    TransactionItem,
+    TransactionListResponse,
+    StatsBucket,
+    MerchantTotal,
+    MonthDelta,
+    StatsResponse,
     ParseResponse
 )
 
 __all__ = [
     "ImageParseRequest",
     "TextParseRequest",
+    "BatchParseRequest",
+    "BatchParseItem",
     "TransactionRequest",
     "TransactionResponse",
+    "BulkTransactionResult",
+    "BulkTransactionResponse",
     "BalanceResponse",
+    "TransactionPosting",
+    "TransactionItem",
+    "TransactionListResponse",
+    "StatsBucket",
+    "MerchantTotal",
+    "MonthDelta",
+    "StatsResponse",
     "ParseResponse"
 ]
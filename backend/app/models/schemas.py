@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 class ImageParseRequest(BaseModel):
     image: str  # base64 encoded image
@@ -17,6 +17,19 @@ class ParseResponse(BaseModel):
     transaction_type: str
     category: str
     description: str
+    cached: bool = False
+    source: str = "vlm"  # "vlm", "cache" or "rule"
+
+class BatchParseRequest(BaseModel):
+    images: List[str] = []  # base64 encoded images
+    texts: List[str] = []
+
+class BatchParseItem(BaseModel):
+    kind: str  # "image" or "text"
+    index: int
+    success: bool
+    result: Optional[ParseResponse] = None
+    error: Optional[str] = None
 
 class TransactionRequest(BaseModel):
     date: str
@@ -33,5 +46,69 @@ class TransactionResponse(BaseModel):
     success: bool
     message: str
 
+class BulkTransactionResult(BaseModel):
+    index: int
+    success: bool
+    message: str
+
+class BulkTransactionResponse(BaseModel):
+    success: bool
+    saved: int
+    failed: int
+    results: List[BulkTransactionResult]
+
 class BalanceResponse(BaseModel):
-    balances: Dict[str, float]
+    balances: Dict[str, float]  # currency 币种的余额，换算时为各币种换算后的合计
+    ledger_version: int = 0
+    as_of: Optional[str] = None
+    currency: str = "CNY"
+    holdings: Dict[str, Dict[str, float]] = {}  # 账户 -> 币种 -> 数量，包含所有币种
+    unconverted: Dict[str, Dict[str, float]] = {}  # 缺少价格、未计入 balances 的部分
+
+class TransactionPosting(BaseModel):
+    account: str
+    amount: Optional[float] = None
+    currency: Optional[str] = None
+
+class TransactionItem(BaseModel):
+    id: str  # 可作为游标，从该交易之后继续翻页
+    date: str
+    flag: str
+    payee: str = ""
+    narration: str = ""
+    tags: List[str] = []
+    postings: List[TransactionPosting]
+
+class TransactionListResponse(BaseModel):
+    items: List[TransactionItem]
+    next_cursor: Optional[str] = None
+    ledger_version: int = 0
+
+class StatsBucket(BaseModel):
+    period: str  # 日/周为日期（周一），月为 YYYY-MM
+    total: float
+    by_category: Dict[str, float]
+    by_account: Dict[str, float]
+    by_payment_method: Dict[str, float]
+
+class MerchantTotal(BaseModel):
+    merchant: str
+    total: float
+    count: int
+
+class MonthDelta(BaseModel):
+    month: str
+    total: float
+    delta: Optional[float] = None
+    change: Optional[float] = None  # 相对上月的变化率，上月为 0 时为空
+
+class StatsResponse(BaseModel):
+    transaction_type: str
+    granularity: str
+    total: float
+    by_category: Dict[str, float]
+    by_account: Dict[str, float]
+    by_payment_method: Dict[str, float]
+    buckets: List[StatsBucket]
+    top_merchants: List[MerchantTotal]
+    month_over_month: List[MonthDelta]
@@ -1,4 +1,5 @@
-from .vlm_factory import get_vlm_service
-from .beancount_ops import BeancountService
+from .vlm_factory import get_vlm_service, VLMProviderRegistry
+from .beancount_ops import BeancountService, get_beancount_service
+from .ledger_cache import LedgerCache, LedgerSnapshot
 
-__all__ = ["get_vlm_service", "BeancountService"]
+__all__ = ["get_vlm_service", "VLMProviderRegistry", "BeancountService", "get_beancount_service", "LedgerCache", "LedgerSnapshot"]
@@ -0,0 +1,321 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from beancount.core import data
+from .ledger_cache import DerivedIndex
+
+# 内置默认配置：账本中没有 open 指令时原样使用，否则只保留账本中已开户（且未关闭）的账户
+DEFAULT_PAYMENT_METHODS = [
+    {"value": "支付宝", "label": "支付宝", "account": "Assets:Cash:Alipay"},
+    {"value": "微信", "label": "微信", "account": "Assets:Cash:WeChat"},
+    {"value": "银行卡", "label": "银行卡", "account": "Assets:Bank"},
+    {"value": "现金", "label": "现金", "account": "Assets:Cash:CNY"},
+]
+
+DEFAULT_BANK_CARDS = [
+    {"bank": "CCB", "bank_name": "建设银行", "last_four": "0388", "account": "Assets:Bank:CCB:0388"},
+    {"bank": "CCB", "bank_name": "建设银行", "last_four": "0349", "account": "Assets:Bank:CCB:0349"},
+    {"bank": "BOC", "bank_name": "中国银行", "last_four": "8735", "account": "Assets:Bank:BOC:8735"},
+    {"bank": "BOC", "bank_name": "中国银行", "last_four": "1969", "account": "Assets:Bank:BOC:1969"},
+    {"bank": "BOC", "bank_name": "中国银行", "last_four": "7870", "account": "Assets:Bank:BOC:7870"},
+    {"bank": "BOC", "bank_name": "中国银行", "last_four": "3469", "account": "Assets:Bank:BOC:3469"},
+    {"bank": "ICBC", "bank_name": "工商银行", "last_four": "4969", "account": "Assets:Bank:ICBC:4969"},
+]
+
+DEFAULT_EXPENSE_CATEGORIES = [
+    # 餐饮类
+    {"value": "早餐", "label": "早餐", "account": "Expenses:Food:Breakfast", "group": "餐饮"},
+    {"value": "午餐", "label": "午餐", "account": "Expenses:Food:Lunch", "group": "餐饮"},
+    {"value": "晚餐", "label": "晚餐", "account": "Expenses:Food:Dinner", "group": "餐饮"},
+    {"value": "零食", "label": "零食水果", "account": "Expenses:Food:Snacks", "group": "餐饮"},
+    {"value": "买菜", "label": "买菜买肉", "account": "Expenses:Food:Groceries", "group": "餐饮"},
+
+    # 交通类
+    {"value": "公交", "label": "公交地铁", "account": "Expenses:Transport:Public", "group": "交通"},
+    {"value": "打车", "label": "打车", "account": "Expenses:Transport:Taxi", "group": "交通"},
+    {"value": "加油", "label": "加油/充电", "account": "Expenses:Transport:Fuel", "group": "交通"},
+
+    # 住房类
+    {"value": "房租", "label": "房租", "account": "Expenses:Housing:Rent", "group": "住房"},
+    {"value": "水电", "label": "水电煤气", "account": "Expenses:Housing:Utilities", "group": "住房"},
+    {"value": "宽带", "label": "宽带话费", "account": "Expenses:Housing:Internet", "group": "住房"},
+
+    # 购物类
+    {"value": "衣服", "label": "衣物鞋包", "account": "Expenses:Shopping:Clothing", "group": "购物"},
+    {"value": "数码", "label": "数码电子", "account": "Expenses:Shopping:Electronics", "group": "购物"},
+    {"value": "日用品", "label": "日用品", "account": "Expenses:Shopping:Daily", "group": "购物"},
+
+    # 娱乐类
+    {"value": "电影", "label": "电影娱乐", "account": "Expenses:Entertainment:Movies", "group": "娱乐"},
+    {"value": "游戏", "label": "游戏", "account": "Expenses:Entertainment:Games", "group": "娱乐"},
+    {"value": "聚餐", "label": "社交聚餐", "account": "Expenses:Entertainment:Social", "group": "娱乐"},
+
+    # 医疗类
+    {"value": "药品", "label": "药品", "account": "Expenses:Health:Medicine", "group": "医疗"},
+    {"value": "看病", "label": "医疗挂号", "account": "Expenses:Health:Hospital", "group": "医疗"},
+
+    # 其他
+    {"value": "红包", "label": "随礼红包", "account": "Expenses:Other:Gifts", "group": "其他"},
+    {"value": "其他", "label": "其他杂项", "account": "Expenses:Other:Misc", "group": "其他"},
+]
+
+DEFAULT_INCOME_CATEGORIES = [
+    {"value": "工资", "label": "工资", "account": "Income:Salary"},
+    {"value": "奖金", "label": "奖金", "account": "Income:Bonus"},
+    {"value": "投资", "label": "投资收益", "account": "Income:Investment"},
+]
+
+DEFAULT_LIABILITY_ACCOUNTS = [
+    {"value": "花呗", "label": "花呗", "account": "Liabilities:Credit:花呗"},
+    {"value": "先用后付", "label": "先用后付", "account": "Liabilities:Credit:先用后付"},
+]
+
+# 不在选项中、但模型或用户常用的分类说法 -> 分类
+DEFAULT_CATEGORY_ALIASES = {
+    "餐饮": "午餐", "水果": "零食",
+    "交通": "公交", "地铁": "公交", "出租车": "打车", "充电": "加油",
+    "水电煤": "水电", "话费": "宽带",
+    "购物": "日用品", "鞋子": "衣服", "电子产品": "数码",
+    "娱乐": "聚餐",
+    "医疗": "看病",
+    "礼物": "红包",
+}
+
+BANK_NAMES = {"CCB": "建设银行", "BOC": "中国银行", "ICBC": "工商银行"}
+
+FALLBACK_EXPENSE_ACCOUNT = "Expenses:Other:Misc"
+FALLBACK_INCOME_ACCOUNT = "Income:Other"
+FALLBACK_BANK_ACCOUNT = "Assets:Bank:Other"
+FALLBACK_ASSET_ACCOUNT = "Assets:Other"
+
+
+@dataclass
+class AccountTables:
+    """某一版本账本编译出的账户映射，构建完成后只读"""
+    config: Dict[str, list]
+    # config 内容的摘要，用作 /api/config/accounts 的 ETag
+    config_digest: str = ""
+    # 分类/别名 -> 账户
+    expense_accounts: Dict[str, str] = field(default_factory=dict)
+    income_accounts: Dict[str, str] = field(default_factory=dict)
+    # 支付方式 -> 账户；(银行, 卡号后四位) -> 账户；银行 -> 该行第一个账户
+    payment_accounts: Dict[str, str] = field(default_factory=dict)
+    card_accounts: Dict[Tuple[str, str], str] = field(default_factory=dict)
+    bank_accounts: Dict[str, str] = field(default_factory=dict)
+    # 账户 -> ParseResponse 字段
+    category_fields: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    payment_fields: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    # 分类 -> 交易类型；别名 -> 分类
+    category_types: Dict[str, str] = field(default_factory=dict)
+    category_aliases: Dict[str, str] = field(default_factory=dict)
+
+
+def _split_aliases(value) -> List[str]:
+    if not isinstance(value, str):
+        return []
+    return [alias.strip() for alias in value.replace("，", ",").split(",") if alias.strip()]
+
+
+def _card_of(account: str, meta: dict) -> Optional[Dict[str, str]]:
+    """识别银行卡账户：Assets:Bank:<银行>:<后四位>，或在 open 元数据中声明 bank/last_four"""
+    parts = account.split(":")
+    last_four = meta.get("last_four")
+    if last_four is None and len(parts) == 4 and parts[:2] == ["Assets", "Bank"] \
+            and len(parts[3]) == 4 and parts[3].isdigit():
+        last_four = parts[3]
+    if last_four is None:
+        return None
+    if not isinstance(last_four, str):
+        # 未加引号的数字会被解析为 Decimal
+        last_four = f"{int(last_four):04d}"
+    bank = str(meta.get("bank") or (parts[2] if len(parts) > 2 else "")).upper()
+    return {
+        "bank": bank,
+        "bank_name": meta.get("bank_name") or BANK_NAMES.get(bank, bank),
+        "last_four": last_four,
+        "account": account,
+    }
+
+
+def _upsert(items: List[dict], item: dict):
+    """元数据声明的条目替换同名或同账户的默认条目，保留其原有位置"""
+    conflicts = [i for i, existing in enumerate(items)
+                 if existing["value"] == item["value"] or existing["account"] == item["account"]]
+    if not conflicts:
+        items.append(item)
+        return
+    items[conflicts[0]] = item
+    for i in reversed(conflicts[1:]):
+        del items[i]
+
+
+class AccountIndex(DerivedIndex):
+    """
+    由账本 open 指令编译出的账户映射索引
+
+    内置默认配置中只保留账本里实际开户的账户，再叠加 open 指令元数据中声明的内容：
+    category/label/group/aliases 定义分类，payment_method 定义支付方式，
+    bank/bank_name/last_four 定义银行卡（Assets:Bank:<银行>:<后四位> 形式的账户可省略）。
+    账本版本变化时整体重建，查询均为字典查找。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._tables = self._compile([])
+
+    def rebuild(self, entries: list):
+        self._tables = self._compile(entries)
+
+    def update(self, entries: list):
+        # 本进程只追加交易，不会产生新的 open/close 指令
+        pass
+
+    @staticmethod
+    def _compile(entries: list) -> AccountTables:
+        opens: Dict[str, data.Open] = {}
+        closed = set()
+        for entry in entries:
+            if isinstance(entry, data.Open):
+                opens.setdefault(entry.account, entry)
+            elif isinstance(entry, data.Close):
+                closed.add(entry.account)
+        active = {account: entry for account, entry in opens.items() if account not in closed}
+
+        def is_open(account: str) -> bool:
+            return not opens or account in active
+
+        expense = [dict(item) for item in DEFAULT_EXPENSE_CATEGORIES if is_open(item["account"])]
+        income = [dict(item) for item in DEFAULT_INCOME_CATEGORIES if is_open(item["account"])]
+        liabilities = [dict(item) for item in DEFAULT_LIABILITY_ACCOUNTS if is_open(item["account"])]
+        payment_methods = [
+            dict(item) for item in DEFAULT_PAYMENT_METHODS
+            if item["value"] == "银行卡" or is_open(item["account"])
+        ]
+        bank_cards = [] if opens else [dict(card) for card in DEFAULT_BANK_CARDS]
+        aliases = dict(DEFAULT_CATEGORY_ALIASES)
+
+        # 按账本中的声明顺序处理，同一银行的第一张卡作为该行默认账户
+        for account, entry in active.items():
+            meta = entry.meta or {}
+            root = account.split(":", 1)[0]
+            category = meta.get("category")
+            if isinstance(category, str) and root in ("Expenses", "Income"):
+                item = {"value": category, "label": meta.get("label") or category, "account": account}
+                if root == "Expenses":
+                    item["group"] = meta.get("group") or "其他"
+                    _upsert(expense, item)
+                else:
+                    _upsert(income, item)
+                for alias in _split_aliases(meta.get("aliases")):
+                    aliases[alias] = category
+
+            payment_method = meta.get("payment_method")
+            if isinstance(payment_method, str) and root in ("Assets", "Liabilities"):
+                _upsert(payment_methods, {
+                    "value": payment_method, "label": meta.get("label") or payment_method, "account": account
+                })
+
+            card = _card_of(account, meta)
+            if card is not None:
+                bank_cards.append(card)
+
+        config = {
+            "payment_methods": payment_methods,
+            "bank_cards": bank_cards,
+            "expense_categories": expense,
+            "income_categories": income,
+            "liability_accounts": liabilities,
+        }
+        tables = AccountTables(
+            config=config,
+            config_digest=hashlib.sha256(
+                json.dumps(config, ensure_ascii=False, sort_keys=True).encode("utf-8")
+            ).hexdigest(),
+        )
+        for key, transaction_type, accounts in (
+            ("expense_categories", "expense", tables.expense_accounts),
+            ("income_categories", "income", tables.income_accounts),
+        ):
+            for item in tables.config[key]:
+                accounts[item["value"]] = item["account"]
+                tables.category_types.setdefault(item["value"], transaction_type)
+                tables.category_fields.setdefault(
+                    item["account"], {"category": item["value"], "transaction_type": transaction_type}
+                )
+        for alias, category in aliases.items():
+            if category not in tables.category_types or alias in tables.category_types:
+                continue
+            tables.category_aliases[alias] = category
+            if category in tables.expense_accounts:
+                tables.expense_accounts[alias] = tables.expense_accounts[category]
+            else:
+                tables.income_accounts[alias] = tables.income_accounts[category]
+
+        for item in payment_methods:
+            if item["value"] == "银行卡":
+                continue
+            tables.payment_accounts[item["value"]] = item["account"]
+            tables.payment_fields[item["account"]] = {
+                "payment_method": item["value"], "bank_name": "", "card_last_four": ""
+            }
+        for card in bank_cards:
+            tables.card_accounts.setdefault((card["bank"], card["last_four"]), card["account"])
+            tables.bank_accounts.setdefault(card["bank"], card["account"])
+            tables.payment_fields[card["account"]] = {
+                "payment_method": "银行卡", "bank_name": card["bank"], "card_last_four": card["last_four"]
+            }
+        return tables
+
+    @property
+    def config(self) -> Dict[str, list]:
+        """/api/config/accounts 的响应内容，调用方不要修改"""
+        return self._tables.config
+
+    @property
+    def config_digest(self) -> str:
+        return self._tables.config_digest
+
+    @property
+    def category_types(self) -> Dict[str, str]:
+        return self._tables.category_types
+
+    @property
+    def category_aliases(self) -> Dict[str, str]:
+        return self._tables.category_aliases
+
+    def asset_account(self, payment_method: str, bank_name: str = "", card_last_four: str = "") -> str:
+        """根据支付方式、银行名称和卡号后四位获取资产账户"""
+        tables = self._tables
+        if payment_method == "银行卡" and bank_name and card_last_four:
+            bank = bank_name.upper()
+            # 先精确匹配银行+卡号后四位，否则用该银行的第一个账户
+            account = tables.card_accounts.get((bank, card_last_four))
+            if account:
+                return account
+            return tables.bank_accounts.get(bank, FALLBACK_BANK_ACCOUNT)
+        return tables.payment_accounts.get(payment_method, FALLBACK_ASSET_ACCOUNT)
+
+    def expense_account(self, category: str) -> str:
+        return self._tables.expense_accounts.get(category, FALLBACK_EXPENSE_ACCOUNT)
+
+    def income_account(self, category: str) -> str:
+        return self._tables.income_accounts.get(category, FALLBACK_INCOME_ACCOUNT)
+
+    def describe(self, category_account: str = "", payment_account: str = "") -> Dict[str, str]:
+        """把账户反向映射为 ParseResponse 中能确定的字段"""
+        tables = self._tables
+        fields = {}
+        fields.update(tables.category_fields.get(category_account, {}))
+        fields.update(tables.payment_fields.get(payment_account, {}))
+        return fields
+
+
+_index: Optional[AccountIndex] = None
+
+
+def get_account_index() -> AccountIndex:
+    global _index
+    if _index is None:
+        _index = AccountIndex()
+    return _index
@@ -0,0 +1,123 @@
+import bisect
+import threading
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from beancount.core import data, prices
+from .ledger_cache import DerivedIndex
+
+# 账户 -> 币种 -> 数量
+Holdings = Dict[str, Dict[str, Decimal]]
+
+
+class BalanceIndex(DerivedIndex):
+    """
+    按日期查询的多币种余额索引
+
+    每个 (账户, 币种) 保存按日期排序的记账日序数及对应的累计余额，
+    任意日期的余额用二分查找得到，不需要重新 realize 账本；
+    price 指令编译为 beancount 的 price map，用于按查询日期换算币种。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._data_lock = threading.Lock()
+        # (账户, 币种) -> (记账日序数, 截至当天的累计余额)
+        self._series: Dict[Tuple[str, str], Tuple[List[int], List[Decimal]]] = {}
+        self._price_map = prices.build_price_map([])
+
+    def rebuild(self, entries: list):
+        changes: Dict[Tuple[str, str], List[Tuple[int, Decimal]]] = defaultdict(list)
+        # 快照中的条目已按日期排序
+        for entry in entries:
+            if not isinstance(entry, data.Transaction):
+                continue
+            day = entry.date.toordinal()
+            for posting in entry.postings:
+                units = posting.units
+                if units is None or units.number is None:
+                    continue
+                changes[(posting.account, units.currency)].append((day, units.number))
+
+        series = {}
+        for key, items in changes.items():
+            days, sums = [], []
+            total = Decimal(0)
+            for day, number in items:
+                total += number
+                if days and days[-1] == day:
+                    sums[-1] = total
+                else:
+                    days.append(day)
+                    sums.append(total)
+            series[key] = (days, sums)
+        price_map = prices.build_price_map(entries)
+
+        with self._data_lock:
+            self._series, self._price_map = series, price_map
+        print(f"Balance index built: series={len(series)}")
+
+    def update(self, entries: list):
+        with self._data_lock:
+            for entry in entries:
+                if not isinstance(entry, data.Transaction):
+                    continue
+                day = entry.date.toordinal()
+                for posting in entry.postings:
+                    units = posting.units
+                    if units is None or units.number is None:
+                        continue
+                    days, sums = self._series.setdefault((posting.account, units.currency), ([], []))
+                    i = bisect.bisect_left(days, day)
+                    if i == len(days) or days[i] != day:
+                        days.insert(i, day)
+                        sums.insert(i, sums[i - 1] if i else Decimal(0))
+                    # 新交易通常日期最新，需要累加的只有末尾几项
+                    for j in range(i, len(sums)):
+                        sums[j] += units.number
+
+    def query(self, as_of: Optional[date] = None, currency: str = "CNY",
+              convert: bool = False) -> Tuple[Holdings, Dict[str, Decimal], Holdings]:
+        """
+        截至 as_of（含当天，None 为全部）的余额，一次加锁读取，各部分对应同一版本
+
+        Args:
+            currency: balances 的币种
+            convert: 是否用 as_of 当天或之前最近的价格把其他币种换算为 currency 计入 balances
+
+        Returns:
+            (各账户各币种余额（省略为 0 的项）, 各账户 currency 余额, 缺少价格而无法换算的部分)
+        """
+        day = as_of.toordinal() if as_of else None
+        holdings: Holdings = defaultdict(dict)
+        with self._data_lock:
+            for (account, unit), (days, sums) in self._series.items():
+                i = len(days) if day is None else bisect.bisect_right(days, day)
+                if i and sums[i - 1]:
+                    holdings[account][unit] = sums[i - 1]
+            price_map = self._price_map
+
+        rates: Dict[str, Optional[Decimal]] = {currency: Decimal(1)}
+        balances: Dict[str, Decimal] = {}
+        missing: Holdings = defaultdict(dict)
+        for account, positions in holdings.items():
+            for unit, number in positions.items():
+                if unit not in rates:
+                    rates[unit] = prices.get_price(price_map, (unit, currency), as_of)[1] if convert else None
+                rate = rates[unit]
+                if rate is not None:
+                    balances[account] = balances.get(account, Decimal(0)) + number * rate
+                elif convert:
+                    missing[account][unit] = number
+        return dict(holdings), balances, dict(missing)
+
+
+_index: Optional[BalanceIndex] = None
+
+
+def get_balance_index() -> BalanceIndex:
+    global _index
+    if _index is None:
+        _index = BalanceIndex()
+    return _index
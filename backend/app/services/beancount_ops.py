@@ -1,13 +1,22 @@
+import math
 import os
+import threading
 from datetime import datetime
-from typing import List, Dict
-from beancount import loader
+from typing import List, Dict, Optional, Tuple, Union
 from beancount.core import data
 from beancount.core.amount import Amount
 from beancount.core.number import D
 from ..config import settings
+from .account_index import AccountIndex, get_account_index
+from .balance_index import BalanceIndex, get_balance_index
+from .ledger_cache import LedgerCache, LedgerSnapshot
+from .ledger_writer import LedgerWriter, PendingTransaction
+from ..utils.file_lock import locked_file
 
 class BeancountService:
+    # 串行化本进程内的写入，保证写入前后的文件状态与写入内容一一对应
+    _write_lock = threading.Lock()
+
     def __init__(self):
         self.main_path = settings.BEANCOUNT_MAIN_PATH
         self.transaction_path = settings.BEANCOUNT_TRANSACTION_PATH
@@ -21,35 +30,158 @@ class BeancountService:
                 f.write(f"; 交易记录\n")
                 f.write(f"; 创建时间: {datetime.now().strftime('%Y-%m-%d')}\n\n")
 
-    def get_accounts(self) -> List[str]:
+    def get_snapshot(self) -> LedgerSnapshot:
+        """获取当前账本快照（进程级缓存，文件未变化时不会重新解析）"""
+        return LedgerCache.get()
+
+    async def aget_snapshot(self) -> LedgerSnapshot:
+        """异步获取账本快照，解析在专用线程池中进行"""
+        return await LedgerCache.aget()
+
+    def get_accounts(self, snapshot: Optional[LedgerSnapshot] = None) -> List[str]:
         try:
-            entries, errors, options = loader.load_file(self.main_path)
-            accounts = set()
-            for entry in entries:
-                if isinstance(entry, data.Open):
-                    accounts.add(entry.account)
-            return sorted(list(accounts))
+            snapshot = snapshot or self.get_snapshot()
+            return list(snapshot.accounts)
         except:
             return []
 
     def get_balances(self) -> Dict[str, float]:
+        """各账户当前的 CNY 余额"""
         try:
-            entries, errors, options = loader.load_file(self.main_path)
-            from beancount.core import realization
-            real_root = realization.realize(entries)
-
-            balances = {}
-            for account in realization.iter_children(real_root):
-                if account.account:
-                    balance = account.balance
-                    if balance:
-                        for pos in balance:
-                            if pos.units.currency == 'CNY':
-                                balances[account.account] = float(pos.units.number)
-            return balances
+            index = get_balance_index()
+            index.refresh(self.get_snapshot())
+            _, balances, _ = index.query()
+            return {account: float(number) for account, number in balances.items()}
         except:
             return {}
 
+    def build_transaction(self,
+                          date: str,
+                          amount: float,
+                          merchant: str,
+                          payment_method: str,
+                          bank_name: str = "",
+                          card_last_four: str = "",
+                          transaction_type: str = "expense",
+                          category: str = "",
+                          description: str = "",
+                          index: Optional[AccountIndex] = None) -> PendingTransaction:
+        """
+        生成待写入的交易文本以及与之完全一致的交易对象
+
+        异步调用方应先 await aaccount_index() 并传入 index，避免在事件循环中检查或解析账本。
+        """
+        from_account, to_account = self._resolve_accounts(
+            transaction_type, payment_method, bank_name, card_last_four, category, index
+        )
+        return self._format_transaction(date, amount, merchant, description, from_account, to_account)
+
+    def build_transactions(self, items: List[Dict],
+                           index: Optional[AccountIndex] = None) -> List[Union[PendingTransaction, Exception]]:
+        """
+        批量生成交易，账户映射在整批内只解析一次
+
+        Args:
+            items: 与 build_transaction 参数相同的字典列表
+            index: 账户映射索引，默认读取与当前账本一致的索引
+
+        Returns:
+            与输入一一对应的列表，无效条目对应其异常
+        """
+        index = index or self.account_index()
+        resolved = {}
+        results = []
+        for item in items:
+            try:
+                key = (
+                    item.get("transaction_type", "expense"),
+                    item["payment_method"],
+                    item.get("bank_name") or "",
+                    item.get("card_last_four") or "",
+                    item.get("category") or "",
+                )
+                if key[0] not in ("expense", "income"):
+                    raise ValueError(f"Unsupported transaction type: {key[0]}")
+                accounts = resolved.get(key)
+                if accounts is None:
+                    accounts = resolved[key] = self._resolve_accounts(*key, index)
+                results.append(self._format_transaction(
+                    item["date"], item["amount"], item["merchant"], item.get("description") or "", *accounts
+                ))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _resolve_accounts(self, transaction_type: str, payment_method: str, bank_name: str,
+                          card_last_four: str, category: str,
+                          index: Optional[AccountIndex] = None) -> Tuple[str, str]:
+        """返回 (转出账户, 转入账户)"""
+        index = index or self.account_index()
+        if transaction_type == "expense":
+            from_account = index.asset_account(payment_method, bank_name, card_last_four)
+            to_account = index.expense_account(category)
+        else:  # income
+            from_account = index.income_account(category)
+            to_account = index.asset_account(payment_method, bank_name, card_last_four)
+        return from_account, to_account
+
+    @staticmethod
+    def _check_string(name: str, value: str):
+        """payee/narration 原样写入引号内，含引号、反斜杠或换行会破坏账本文件"""
+        if any(c in value for c in '"\\\r\n'):
+            raise ValueError(f"{name} must not contain quotes, backslashes or line breaks")
+
+    def _format_transaction(self, date: str, amount: float, merchant: str, description: str,
+                            from_account: str, to_account: str) -> PendingTransaction:
+        """
+        校验并生成交易文本，校验失败抛出 ValueError，不会写入任何内容
+
+        同一次追加写入的交易共用一个文件，任何一笔格式错误都会影响整批，因此在这里逐笔拦截。
+        """
+        day = datetime.strptime(date, '%Y-%m-%d').date()
+        if not math.isfinite(amount):
+            raise ValueError(f"Invalid amount: {amount}")
+        number = D(f"{amount:.2f}")
+        if number <= 0:
+            raise ValueError(f"Amount must be greater than 0: {amount}")
+        payee = merchant if merchant else ""
+        narration = description if description else merchant
+        self._check_string("merchant", payee)
+        self._check_string("description", narration)
+
+        # 构建交易记录
+        transaction_text = f'\n{day.isoformat()} * "{payee}" "{narration}"\n'
+        transaction_text += f'  {to_account}  {number} CNY\n'
+        transaction_text += f'  {from_account}  -{number} CNY\n'
+
+        # 与写入文本完全一致的交易对象，用于增量更新缓存
+        entry = data.Transaction(
+            data.new_metadata(self.transaction_path, 0),
+            day,
+            '*', payee, narration, data.EMPTY_SET, data.EMPTY_SET,
+            [
+                data.Posting(to_account, Amount(number, 'CNY'), None, None, None, None),
+                data.Posting(from_account, Amount(-number, 'CNY'), None, None, None, None),
+            ]
+        )
+        return PendingTransaction(text=transaction_text, entry=entry)
+
+    def write_transactions(self, items: List[PendingTransaction]):
+        """
+        一次加锁写入多笔交易并 fsync，随后增量更新账本缓存
+
+        文件锁保证多个进程同时写入时内容不会交错。
+        """
+        with self._write_lock:
+            with open(self.transaction_path, 'a', encoding='utf-8') as f:
+                with locked_file(f):
+                    stat_before = LedgerCache.stat_file(self.transaction_path)
+                    f.write(''.join(item.text for item in items))
+                    f.flush()
+                    os.fsync(f.fileno())
+                    stat_after = LedgerCache.stat_file(self.transaction_path)
+            LedgerCache.record_append(self.transaction_path, [item.entry for item in items], stat_before, stat_after)
+
     def append_transaction(self,
                           date: str,
                           amount: float,
@@ -60,199 +192,101 @@ class BeancountService:
                           transaction_type: str = "expense",
                           category: str = "",
                           description: str = "") -> bool:
+        """同步追加单笔交易"""
         try:
-            # 构建账户名称
-            if transaction_type == "expense":
-                from_account = self._get_asset_account(payment_method, bank_name, card_last_four)
-                to_account = self._get_expense_account(category)
-            else:  # income
-                from_account = self._get_income_account(category)
-                to_account = self._get_asset_account(payment_method, bank_name, card_last_four)
-
-            # 构建交易记录
-            payee = merchant if merchant else ""
-            narration = description if description else merchant
-
-            transaction_text = f'\n{date} * "{payee}" "{narration}"\n'
-            transaction_text += f'  {to_account}  {amount:.2f} CNY\n'
-            transaction_text += f'  {from_account}  -{amount:.2f} CNY\n'
-
-            # 追加到交易文件
-            with open(self.transaction_path, 'a', encoding='utf-8') as f:
-                f.write(transaction_text)
+            pending = self.build_transaction(
+                date, amount, merchant, payment_method, bank_name, card_last_four,
+                transaction_type, category, description
+            )
+            self.write_transactions([pending])
+            return True
+        except Exception as e:
+            print(f"Error appending transaction: {e}")
+            return False
 
+    async def append_transaction_async(self,
+                                       date: str,
+                                       amount: float,
+                                       merchant: str,
+                                       payment_method: str,
+                                       bank_name: str = "",
+                                       card_last_four: str = "",
+                                       transaction_type: str = "expense",
+                                       category: str = "",
+                                       description: str = "") -> bool:
+        """通过单写者队列追加单笔交易，写入持久化后返回"""
+        try:
+            index = await self.aaccount_index()
+            pending = self.build_transaction(
+                date, amount, merchant, payment_method, bank_name, card_last_four,
+                transaction_type, category, description, index=index
+            )
+            await LedgerWriter.submit([pending])
             return True
         except Exception as e:
             print(f"Error appending transaction: {e}")
             return False
 
-    def _get_asset_account(self, payment_method: str, bank_name: str = "", card_last_four: str = "") -> str:
+    async def append_transactions_async(self, items: List[PendingTransaction]):
+        """通过单写者队列一次追加多笔交易，写入持久化后返回，失败时抛出异常"""
+        await LedgerWriter.submit(items)
+
+    def account_index(self) -> AccountIndex:
         """
-        根据支付方式、银行名称和卡号后四位获取资产账户
-        
-        银行卡账户映射规则：
-        - CCB (建设银行): 0388, 0349
-        - BOC (中国银行): 8735, 1969, 7870, 3469
-        - ICBC (工商银行): 4969
+        获取与当前账本一致的账户映射索引，账本版本未变化时不重建
+
+        会同步检查（必要时解析）账本，只用于同步调用方；异步代码使用 aaccount_index()。
         """
-        if payment_method == "银行卡" and bank_name and card_last_four:
-            # 尝试精确匹配银行+卡号后四位
-            bank_card_map = {
-                ("CCB", "0388"): "Assets:Bank:CCB:0388",
-                ("CCB", "0349"): "Assets:Bank:CCB:0349",
-                ("BOC", "8735"): "Assets:Bank:BOC:8735",
-                ("BOC", "1969"): "Assets:Bank:BOC:1969",
-                ("BOC", "7870"): "Assets:Bank:BOC:7870",
-                ("BOC", "3469"): "Assets:Bank:BOC:3469",
-                ("ICBC", "4969"): "Assets:Bank:ICBC:4969",
-            }
-            account = bank_card_map.get((bank_name.upper(), card_last_four))
-            if account:
-                return account
-            
-            # 如果没有精确匹配，但有银行名称，返回该银行的第一个账户
-            bank_default = {
-                "CCB": "Assets:Bank:CCB:0388",
-                "BOC": "Assets:Bank:BOC:8735",
-                "ICBC": "Assets:Bank:ICBC:4969",
-            }
-            return bank_default.get(bank_name.upper(), "Assets:Bank:Other")
-        
-        # 非银行卡支付方式
-        method_map = {
-            "支付宝": "Assets:Cash:Alipay",
-            "微信": "Assets:Cash:WeChat",
-            "现金": "Assets:Cash:CNY"
-        }
-        return method_map.get(payment_method, "Assets:Other")
+        index = get_account_index()
+        index.refresh(self.get_snapshot())
+        return index
+
+    async def aaccount_index(self) -> AccountIndex:
+        """account_index() 的异步版本，重建在解析线程池中进行"""
+        index = get_account_index()
+        await index.arefresh()
+        return index
+
+    async def abalance_index(self) -> BalanceIndex:
+        """获取与当前账本一致的多币种余额索引，重建在解析线程池中进行"""
+        index = get_balance_index()
+        await index.arefresh()
+        return index
+
+    def _get_asset_account(self, payment_method: str, bank_name: str = "", card_last_four: str = "") -> str:
+        """根据支付方式、银行名称和卡号后四位获取资产账户"""
+        return self.account_index().asset_account(payment_method, bank_name, card_last_four)
 
     def _get_expense_account(self, category: str) -> str:
-        """
-        根据分类获取支出账户，严格匹配accounts.beancount中的账户层级
-        """
-        category_map = {
-            # 餐饮类
-            "餐饮": "Expenses:Food:Lunch",
-            "早餐": "Expenses:Food:Breakfast",
-            "午餐": "Expenses:Food:Lunch",
-            "晚餐": "Expenses:Food:Dinner",
-            "零食": "Expenses:Food:Snacks",
-            "水果": "Expenses:Food:Snacks",
-            "买菜": "Expenses:Food:Groceries",
-            
-            # 交通类
-            "交通": "Expenses:Transport:Public",
-            "公交": "Expenses:Transport:Public",
-            "地铁": "Expenses:Transport:Public",
-            "打车": "Expenses:Transport:Taxi",
-            "出租车": "Expenses:Transport:Taxi",
-            "加油": "Expenses:Transport:Fuel",
-            "充电": "Expenses:Transport:Fuel",
-            
-            # 住房类
-            "房租": "Expenses:Housing:Rent",
-            "水电": "Expenses:Housing:Utilities",
-            "水电煤": "Expenses:Housing:Utilities",
-            "宽带": "Expenses:Housing:Internet",
-            "话费": "Expenses:Housing:Internet",
-            
-            # 购物类
-            "购物": "Expenses:Shopping:Daily",
-            "衣服": "Expenses:Shopping:Clothing",
-            "鞋子": "Expenses:Shopping:Clothing",
-            "数码": "Expenses:Shopping:Electronics",
-            "电子产品": "Expenses:Shopping:Electronics",
-            "日用品": "Expenses:Shopping:Daily",
-            
-            # 娱乐类
-            "娱乐": "Expenses:Entertainment:Social",
-            "电影": "Expenses:Entertainment:Movies",
-            "游戏": "Expenses:Entertainment:Games",
-            "聚餐": "Expenses:Entertainment:Social",
-            
-            # 医疗类
-            "医疗": "Expenses:Health:Hospital",
-            "药品": "Expenses:Health:Medicine",
-            "看病": "Expenses:Health:Hospital",
-            
-            # 其他
-            "红包": "Expenses:Other:Gifts",
-            "礼物": "Expenses:Other:Gifts",
-        }
-        return category_map.get(category, "Expenses:Other:Misc")
+        """根据分类获取支出账户，只映射到账本中已开户的账户"""
+        return self.account_index().expense_account(category)
 
     def _get_income_account(self, category: str) -> str:
-        category_map = {
-            "工资": "Income:Salary",
-            "奖金": "Income:Bonus",
-            "投资": "Income:Investment"
-        }
-        return category_map.get(category, "Income:Other")
+        return self.account_index().income_account(category)
+
+    def describe_accounts(self, category_account: str = "", payment_account: str = "") -> Dict[str, str]:
+        """
+        把账户反向映射为 ParseResponse 中的字段
+
+        Returns:
+            category/transaction_type 以及 payment_method/bank_name/card_last_four 中能确定的部分
+        """
+        return self.account_index().describe(category_account, payment_account)
 
     def get_account_config(self) -> Dict:
         """
         获取账户配置，包括支付方式、分类等
-        这些配置与 accounts.beancount 严格对应
+        由账本中的 open 指令及其元数据编译而来，与账本严格对应
         """
-        return {
-            "payment_methods": [
-                {"value": "支付宝", "label": "支付宝", "account": "Assets:Cash:Alipay"},
-                {"value": "微信", "label": "微信", "account": "Assets:Cash:WeChat"},
-                {"value": "银行卡", "label": "银行卡", "account": "Assets:Bank"},
-                {"value": "现金", "label": "现金", "account": "Assets:Cash:CNY"},
-            ],
-            "bank_cards": [
-                {"bank": "CCB", "bank_name": "建设银行", "last_four": "0388", "account": "Assets:Bank:CCB:0388"},
-                {"bank": "CCB", "bank_name": "建设银行", "last_four": "0349", "account": "Assets:Bank:CCB:0349"},
-                {"bank": "BOC", "bank_name": "中国银行", "last_four": "8735", "account": "Assets:Bank:BOC:8735"},
-                {"bank": "BOC", "bank_name": "中国银行", "last_four": "1969", "account": "Assets:Bank:BOC:1969"},
-                {"bank": "BOC", "bank_name": "中国银行", "last_four": "7870", "account": "Assets:Bank:BOC:7870"},
-                {"bank": "BOC", "bank_name": "中国银行", "last_four": "3469", "account": "Assets:Bank:BOC:3469"},
-                {"bank": "ICBC", "bank_name": "工商银行", "last_four": "4969", "account": "Assets:Bank:ICBC:4969"},
-            ],
-            "expense_categories": [
-                # 餐饮类
-                {"value": "早餐", "label": "早餐", "account": "Expenses:Food:Breakfast", "group": "餐饮"},
-                {"value": "午餐", "label": "午餐", "account": "Expenses:Food:Lunch", "group": "餐饮"},
-                {"value": "晚餐", "label": "晚餐", "account": "Expenses:Food:Dinner", "group": "餐饮"},
-                {"value": "零食", "label": "零食水果", "account": "Expenses:Food:Snacks", "group": "餐饮"},
-                {"value": "买菜", "label": "买菜买肉", "account": "Expenses:Food:Groceries", "group": "餐饮"},
-                
-                # 交通类
-                {"value": "公交", "label": "公交地铁", "account": "Expenses:Transport:Public", "group": "交通"},
-                {"value": "打车", "label": "打车", "account": "Expenses:Transport:Taxi", "group": "交通"},
-                {"value": "加油", "label": "加油/充电", "account": "Expenses:Transport:Fuel", "group": "交通"},
-                
-                # 住房类
-                {"value": "房租", "label": "房租", "account": "Expenses:Housing:Rent", "group": "住房"},
-                {"value": "水电", "label": "水电煤气", "account": "Expenses:Housing:Utilities", "group": "住房"},
-                {"value": "宽带", "label": "宽带话费", "account": "Expenses:Housing:Internet", "group": "住房"},
-                
-                # 购物类
-                {"value": "衣服", "label": "衣物鞋包", "account": "Expenses:Shopping:Clothing", "group": "购物"},
-                {"value": "数码", "label": "数码电子", "account": "Expenses:Shopping:Electronics", "group": "购物"},
-                {"value": "日用品", "label": "日用品", "account": "Expenses:Shopping:Daily", "group": "购物"},
-                
-                # 娱乐类
-                {"value": "电影", "label": "电影娱乐", "account": "Expenses:Entertainment:Movies", "group": "娱乐"},
-                {"value": "游戏", "label": "游戏", "account": "Expenses:Entertainment:Games", "group": "娱乐"},
-                {"value": "聚餐", "label": "社交聚餐", "account": "Expenses:Entertainment:Social", "group": "娱乐"},
-                
-                # 医疗类
-                {"value": "药品", "label": "药品", "account": "Expenses:Health:Medicine", "group": "医疗"},
-                {"value": "看病", "label": "医疗挂号", "account": "Expenses:Health:Hospital", "group": "医疗"},
-                
-                # 其他
-                {"value": "红包", "label": "随礼红包", "account": "Expenses:Other:Gifts", "group": "其他"},
-                {"value": "其他", "label": "其他杂项", "account": "Expenses:Other:Misc", "group": "其他"},
-            ],
-            "income_categories": [
-                {"value": "工资", "label": "工资", "account": "Income:Salary"},
-                {"value": "奖金", "label": "奖金", "account": "Income:Bonus"},
-                {"value": "投资", "label": "投资收益", "account": "Income:Investment"},
-            ],
-            "liability_accounts": [
-                {"value": "花呗", "label": "花呗", "account": "Liabilities:Credit:花呗"},
-                {"value": "先用后付", "label": "先用后付", "account": "Liabilities:Credit:先用后付"},
-            ]
-        }
+        return self.account_index().config
+
+
+_service: Optional[BeancountService] = None
+
+
+def get_beancount_service() -> BeancountService:
+    """获取共享的 BeancountService 实例，避免每个请求重复检查交易文件"""
+    global _service
+    if _service is None:
+        _service = BeancountService()
+    return _service
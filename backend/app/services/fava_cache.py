@@ -0,0 +1,90 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from ..config import settings
+
+# 缓存的响应中不保留的头部，ETag 和长度由缓存重新生成
+UNCACHED_HEADERS = {"content-length", "date", "etag", "last-modified", "set-cookie", "cache-control", "expires"}
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    etag: str
+
+
+class FavaResponseCache:
+    """
+    Fava 响应的内存缓存
+
+    静态资源按 URL 缓存；HTML 报表页面的键额外包含账本指纹，
+    账本文件变化后指纹随之变化，旧页面自然失效。
+    总大小超过 FAVA_CACHE_MAX_BYTES 时淘汰最久未使用的条目。
+    """
+
+    _entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+    _size = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path: str, query: str, accept_encoding: str, fingerprint: Optional[str]) -> str:
+        """
+        Args:
+            path: /fava/ 之后的路径
+            query: 查询字符串
+            accept_encoding: 客户端的 Accept-Encoding，不同编码的响应分开缓存
+            fingerprint: 账本指纹，静态资源为 None
+        """
+        return f"{fingerprint}\0{path}\0{query}\0{accept_encoding}"
+
+    @staticmethod
+    def is_cacheable(status_code: int, headers, max_bytes: int) -> bool:
+        """只缓存声明了长度且不大的 200 响应，带 set-cookie 或 no-store 的不缓存"""
+        if status_code != 200 or "set-cookie" in headers:
+            return False
+        if "no-store" in headers.get("cache-control", ""):
+            return False
+        length = headers.get("content-length")
+        return length is not None and length.isdigit() and int(length) <= max_bytes
+
+    @classmethod
+    def get(cls, key: str) -> Optional[CachedResponse]:
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None:
+                cls._entries.move_to_end(key)
+            return entry
+
+    @classmethod
+    def put(cls, key: str, status_code: int, headers: List[Tuple[str, str]], body: bytes) -> CachedResponse:
+        entry = CachedResponse(
+            status_code=status_code,
+            headers=[(k, v) for k, v in headers if k.lower() not in UNCACHED_HEADERS],
+            body=body,
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+        )
+        with cls._lock:
+            old = cls._entries.pop(key, None)
+            if old is not None:
+                cls._size -= len(old.body)
+            cls._entries[key] = entry
+            cls._size += len(body)
+            while cls._size > settings.FAVA_CACHE_MAX_BYTES and cls._entries:
+                _, evicted = cls._entries.popitem(last=False)
+                cls._size -= len(evicted.body)
+        return entry
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._size = 0
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return {"entries": len(cls._entries), "bytes": cls._size}
@@ -0,0 +1,147 @@
+from typing import Optional
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from .fava_cache import CachedResponse, FavaResponseCache
+from .fava_service import FavaService
+from .ledger_cache import LedgerCache
+from ..config import settings
+from ..utils.http_cache import is_not_modified
+
+# 逐跳头部只对单个连接有效，不能原样转发
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+}
+
+
+class FavaProxy:
+    """
+    Fava 反向代理
+
+    所有请求共享一个长连接池；请求体和响应体都按块流式转发，
+    不在内存中缓冲整页内容，压缩后的响应（content-encoding）原样透传给浏览器。
+    静态资源和 HTML 报表页面的 GET 请求经 FavaResponseCache 缓存，并支持 If-None-Match；
+    Fava 的 JSON 接口（<bfile>/api/...）有状态，总是转发给上游。
+    """
+
+    _client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def startup(cls):
+        """创建到 Fava 的共享连接池"""
+        if cls._client is not None:
+            return
+        cls._client = httpx.AsyncClient(
+            base_url=FavaService.get_url(),
+            limits=httpx.Limits(
+                max_connections=settings.FAVA_PROXY_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.FAVA_PROXY_MAX_CONNECTIONS,
+            ),
+            timeout=settings.FAVA_PROXY_TIMEOUT,
+        )
+
+    @classmethod
+    async def shutdown(cls):
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        if cls._client is None:
+            cls.startup()
+        return cls._client
+
+    @classmethod
+    async def forward(cls, request: Request, path: str) -> Response:
+        """
+        将请求转发到 Fava 并流式返回响应
+
+        Args:
+            request: 原始请求
+            path: /fava/ 之后的路径
+        """
+        cache_key = None
+        static = path.startswith("static/")
+        if request.method == "GET" and "api" not in path.split("/"):
+            # 只检查文件状态，不在本进程中解析账本；尚未解析过时页面不缓存
+            fingerprint = None if static else LedgerCache.current_fingerprint()
+            if static or fingerprint is not None:
+                cache_key = FavaResponseCache.make_key(
+                    path, request.url.query, request.headers.get("accept-encoding", ""), fingerprint
+                )
+                cached = FavaResponseCache.get(cache_key)
+                if cached is not None:
+                    return cls._cached_response(request, cached, static)
+
+        # 可缓存的请求由本地校验条件头，上游总是返回完整内容
+        skipped = {"host", "cookie"} | ({"if-none-match", "if-modified-since"} if cache_key else set())
+        headers = [
+            (k, v) for k, v in request.headers.items()
+            if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in skipped
+        ]
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+        client = cls._get_client()
+        upstream_request = client.build_request(
+            method=request.method,
+            url=f"/fava/{path}",
+            params=request.query_params.multi_items(),
+            headers=headers,
+            content=request.stream() if has_body else None,
+        )
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+        except httpx.ConnectError:
+            raise HTTPException(status_code=503, detail="Fava service is not reachable")
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Fava service timed out")
+
+        max_bytes = settings.FAVA_CACHE_MAX_ITEM_BYTES
+        cacheable = cache_key is not None and (
+            static or upstream.headers.get("content-type", "").startswith("text/html")
+        ) and FavaResponseCache.is_cacheable(upstream.status_code, upstream.headers, max_bytes)
+        if cacheable:
+            try:
+                body = await upstream.aread()
+            finally:
+                await upstream.aclose()
+            cached = FavaResponseCache.put(
+                cache_key, upstream.status_code, upstream.headers.multi_items(), body
+            )
+            return cls._cached_response(request, cached, static)
+
+        response = StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            background=BackgroundTask(upstream.aclose),
+        )
+        # 用 multi_items 保留重复的头部（如多个 set-cookie）
+        for key, value in upstream.headers.multi_items():
+            if key.lower() not in HOP_BY_HOP_HEADERS:
+                response.headers.append(key, value)
+        return response
+
+    @staticmethod
+    def _cached_response(request: Request, cached: CachedResponse, static: bool) -> Response:
+        if static:
+            # 静态资源 URL 带有 mtime 查询参数，内容变化时 URL 随之变化
+            max_age = settings.FAVA_STATIC_MAX_AGE if request.url.query else 3600
+            cache_control = f"public, max-age={max_age}" + (", immutable" if request.url.query else "")
+        else:
+            # 页面随账本变化，浏览器每次都需要重新验证
+            cache_control = "private, no-cache"
+
+        headers = {"etag": cached.etag, "cache-control": cache_control}
+        if is_not_modified(request, cached.etag):
+            return Response(status_code=304, headers=headers)
+
+        response = Response(content=cached.body, status_code=cached.status_code)
+        for key, value in cached.headers:
+            if key.lower() not in HOP_BY_HOP_HEADERS:
+                response.headers.append(key, value)
+        for key, value in headers.items():
+            response.headers[key] = value
+        return response
@@ -1,46 +1,337 @@
 import subprocess
 import os
 import signal
+import threading
+import time
+import urllib.error
+import urllib.request
 from typing import Optional
 from ..config import settings
+from ..utils.file_lock import try_lock
+from .ledger_cache import LedgerCache
+
+
+def _create_shared_ledger(path: str):
+    """创建以 LedgerCache 版本号作为重新加载依据的 FavaLedger"""
+    from fava.core import FavaLedger
+
+    class SharedFavaLedger(FavaLedger):
+        """
+        进程内 Fava 使用的账本
+
+        不再用 Fava 自己的文件监视判断是否重新加载，而是跟随 LedgerCache 的版本号，
+        外部修改和 append_transaction 写入都通过同一个版本号通知 API 和 Fava。
+        """
+
+        def __init__(self, path: str):
+            self._reload_lock = threading.Lock()
+            self.ledger_version = 0
+            super().__init__(path)
+
+        def load_file(self):
+            # 先记录版本再加载，加载期间的写入会在下次检查时发现
+            self.ledger_version = LedgerCache.get().version
+            super().load_file()
+
+        def changed(self) -> bool:
+            with self._reload_lock:
+                if LedgerCache.get().version == self.ledger_version:
+                    return False
+                self.load_file()
+                return True
+
+    return SharedFavaLedger(path)
+
 
 class FavaService:
-    """Fava服务管理类"""
+    """
+    Fava服务管理类
+
+    进程模式下由后台监护线程负责：持续读取 Fava 的输出写入日志（避免管道写满阻塞），
+    启动后探测 HTTP 就绪才放行代理请求，进程意外退出时按指数退避自动重启。
+
+    多个 worker 同时运行时，通过 FAVA_LOCK_PATH 上的文件锁选出唯一的 leader 启动 Fava，
+    其余 worker 作为 follower 只探测其就绪状态并代理请求；leader 退出后锁被释放，
+    follower 会接管。stop 在锁文件旁写入停止标记，对所有 worker 生效，
+    标记存在期间 leader 退为 follower，follower 也不接管，直到再次 start。
+    """
     
     _process: Optional[subprocess.Popen] = None
     _port: int = 5000
+    # FAVA_MODE=wsgi 时进程内的 Fava Flask 应用
+    _wsgi_app = None
+
+    # 监护状态
+    _state_lock = threading.Lock()
+    _supervisor: Optional[threading.Thread] = None
+    _stopping = threading.Event()
+    _ready = threading.Event()
+    _started_at: float = 0.0
+    _startup_latency: Optional[float] = None
+    _restarts: int = 0
+    _last_exit_code: Optional[int] = None
+    # "leader" 或 "follower"，以及 leader 持有的锁文件
+    _role: Optional[str] = None
+    _leader_file = None
     
     @classmethod
     def start(cls, port: int = 5000) -> bool:
-        """启动Fava服务"""
-        if cls._process is not None:
-            print("Fava is already running")
+        """启动Fava服务，立即返回，就绪状态由监护线程探测"""
+        if settings.FAVA_MODE == "wsgi":
+            return cls._start_wsgi()
+
+        with cls._state_lock:
+            # 清除停止标记，已在运行的 follower 会在下一次轮询时接管
+            try:
+                os.remove(cls._stop_marker())
+            except FileNotFoundError:
+                pass
+            if cls._supervisor is not None and cls._supervisor.is_alive():
+                print("Fava is already running")
+                return True
+
+            cls._port = port
+            cls._stopping.clear()
+            cls._ready.clear()
+            cls._restarts = 0
+            cls._startup_latency = None
+            cls._last_exit_code = None
+            if cls._acquire_leadership():
+                cls._role = "leader"
+                if not cls._spawn():
+                    cls._release_leadership()
+                    return False
+            else:
+                cls._role = "follower"
+                print("Fava is owned by another worker, following")
+            cls._supervisor = threading.Thread(target=cls._monitor, name="fava-supervisor", daemon=True)
+            cls._supervisor.start()
             return True
-        
+
+    @classmethod
+    def _acquire_leadership(cls) -> bool:
+        """尝试获取 Fava 的 leader 锁，成功后在锁文件中记录 pid"""
+        f = open(settings.FAVA_LOCK_PATH, 'a+')
+        if not try_lock(f):
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        cls._leader_file = f
+        return True
+
+    @classmethod
+    def _release_leadership(cls):
+        if cls._leader_file is not None:
+            cls._leader_file.close()
+            cls._leader_file = None
+
+    @staticmethod
+    def _stop_marker() -> str:
+        return settings.FAVA_LOCK_PATH + ".stopped"
+
+    @classmethod
+    def _stop_requested(cls) -> bool:
+        """是否有 worker 调用了 stop 且之后没有再 start"""
+        return os.path.exists(cls._stop_marker())
+
+    @classmethod
+    def _monitor(cls):
+        """监护线程：leader 监护 Fava 进程，follower 定期探测就绪状态，并在锁空闲且未被停止时接管"""
+        while not cls._stopping.is_set():
+            if cls._role == "leader":
+                # 进程被停止或本 worker 退为 follower 时返回
+                cls._supervise()
+                continue
+
+            with cls._state_lock:
+                if cls._stopping.is_set():
+                    return
+                if not cls._stop_requested() and cls._acquire_leadership():
+                    print("Fava lock is free, taking over")
+                    cls._role = "leader"
+                    cls._ready.clear()
+                    cls._spawn()
+                    continue
+
+            if cls._probe():
+                cls._ready.set()
+            else:
+                cls._ready.clear()
+            cls._stopping.wait(settings.FAVA_FOLLOWER_POLL_INTERVAL)
+
+    @classmethod
+    def _spawn(cls) -> bool:
+        """启动 Fava 进程，调用方需持有 _state_lock"""
         try:
-            cls._port = port
+            cls._started_at = time.monotonic()
             # 启动fava服务，绑定到0.0.0.0以支持外部访问，使用 /fava 前缀
             cls._process = subprocess.Popen(
                 [
                     "fava",
                     settings.BEANCOUNT_MAIN_PATH,
-                    "-p", str(port),
+                    "-p", str(cls._port),
                     "--host", "0.0.0.0",
                     "--prefix", "/fava"
                 ],
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
                 creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0
             )
-            print(f"Fava started on port {port}")
+            threading.Thread(target=cls._drain, args=(cls._process,), name="fava-output", daemon=True).start()
+            print(f"Fava started on port {cls._port}, pid={cls._process.pid}")
             return True
         except Exception as e:
+            cls._process = None
             print(f"Failed to start Fava: {e}")
             return False
+
+    @staticmethod
+    def _drain(process: subprocess.Popen):
+        """逐行读取 Fava 输出直到进程退出"""
+        for line in iter(process.stdout.readline, b""):
+            print(f"[fava] {line.decode('utf-8', errors='replace').rstrip()}")
+        process.stdout.close()
+
+    @classmethod
+    def _probe(cls) -> bool:
+        """Fava 能响应 HTTP 请求即视为就绪，状态码不限"""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{cls._port}/fava/", timeout=2):
+                return True
+        except urllib.error.HTTPError:
+            return True
+        except OSError:
+            return False
+
+    @classmethod
+    def _wait_ready(cls, process: subprocess.Popen):
+        deadline = cls._started_at + settings.FAVA_READY_TIMEOUT
+        while process.poll() is None and not cls._stopping.is_set():
+            if cls._probe():
+                cls._startup_latency = time.monotonic() - cls._started_at
+                cls._ready.set()
+                print(f"Fava ready in {cls._startup_latency:.2f}s")
+                return
+            if time.monotonic() > deadline:
+                print(f"Fava not ready after {settings.FAVA_READY_TIMEOUT}s, restarting")
+                process.kill()
+                return
+            cls._stopping.wait(0.2)
+
+    @classmethod
+    def _supervise(cls):
+        backoff = 1.0
+        while not cls._stopping.is_set():
+            process = cls._process
+            if process is not None:
+                cls._wait_ready(process)
+                while process.poll() is None and not cls._stop_requested() and not cls._stopping.wait(1.0):
+                    pass
+            if cls._stopping.is_set():
+                return
+            if cls._stop_requested():
+                # 本 worker 或其他 worker 调用了 stop
+                cls._step_down()
+                return
+            if cls._role != "leader":
+                return
+
+            cls._ready.clear()
+            # 稳定运行一段时间后再退出的，退避时间从头开始
+            if time.monotonic() - cls._started_at > settings.FAVA_RESTART_MAX_BACKOFF:
+                backoff = 1.0
+            cls._last_exit_code = process.returncode if process is not None else None
+            print(f"Fava exited with code {cls._last_exit_code}, restarting in {backoff:.0f}s")
+            if cls._stopping.wait(backoff):
+                return
+            backoff = min(backoff * 2, settings.FAVA_RESTART_MAX_BACKOFF)
+
+            with cls._state_lock:
+                if cls._stopping.is_set() or cls._role != "leader":
+                    return
+                cls._restarts += 1
+                cls._spawn()
     
+    @classmethod
+    def _start_wsgi(cls) -> bool:
+        """在当前进程内创建 Fava 应用，由 FastAPI 直接挂载到 /fava"""
+        if cls._wsgi_app is not None:
+            return True
+        try:
+            from fava.application import create_app
+            from fava.util import slugify
+
+            fava_app = create_app([settings.BEANCOUNT_MAIN_PATH])
+            ledger = _create_shared_ledger(settings.BEANCOUNT_MAIN_PATH)
+            slug = slugify(ledger.options["title"]) or slugify(ledger.beancount_file_path)
+            fava_app.config["LEDGERS"] = {slug: ledger}
+            cls._wsgi_app = fava_app
+            print("Fava mounted in-process at /fava")
+            return True
+        except Exception as e:
+            print(f"Failed to start Fava: {e}")
+            return False
+
+    @classmethod
+    def get_wsgi_app(cls):
+        """返回进程内的 Fava 应用，未启动时为 None"""
+        return cls._wsgi_app
+
     @classmethod
     def stop(cls) -> bool:
-        """停止Fava服务"""
+        """
+        停止Fava服务，对所有 worker 生效
+
+        写入停止标记后，本 worker 是 leader 时立即结束 Fava 进程；
+        leader 在其他 worker 上时，由其监护线程在一秒内发现标记并结束进程。
+        各 worker 的监护线程继续以 follower 运行，再次 start 后由其中之一接管。
+        """
+        if settings.FAVA_MODE == "wsgi":
+            cls._wsgi_app = None
+            return True
+
+        with open(cls._stop_marker(), 'w') as f:
+            f.write(str(os.getpid()))
+        return cls._step_down()
+
+    @classmethod
+    def _step_down(cls) -> bool:
+        """leader 结束 Fava 进程并释放锁，转为 follower"""
+        with cls._state_lock:
+            cls._ready.clear()
+            if cls._role != "leader":
+                return True
+            stopped = cls._terminate()
+            cls._release_leadership()
+            cls._role = "follower"
+            print("Fava stopped on request, following")
+            return stopped
+
+    @classmethod
+    def shutdown(cls):
+        """
+        worker 退出时停止监护线程及本 worker 启动的 Fava
+
+        不写停止标记，本 worker 是 leader 时锁被释放，其他 worker 会接管。
+        """
+        if settings.FAVA_MODE == "wsgi":
+            cls._wsgi_app = None
+            return
+
+        with cls._state_lock:
+            cls._stopping.set()
+            cls._ready.clear()
+            supervisor, cls._supervisor = cls._supervisor, None
+            cls._terminate()
+            cls._release_leadership()
+        if supervisor is not None:
+            supervisor.join(timeout=5)
+
+    @classmethod
+    def _terminate(cls) -> bool:
         if cls._process is None:
             return True
         
@@ -66,11 +357,34 @@ class FavaService:
     @classmethod
     def is_running(cls) -> bool:
         """检查Fava是否在运行"""
+        if settings.FAVA_MODE == "wsgi":
+            return cls._wsgi_app is not None
+
+        if cls._role == "follower":
+            return cls._ready.is_set()
+
         if cls._process is None:
             return False
         
-        # 检查进程是否还在运行
-        return cls._process.poll() is None
+        # 进程在运行且已通过就绪探测
+        return cls._process.poll() is None and cls._ready.is_set()
+
+    @classmethod
+    def status(cls) -> dict:
+        """运行状态、启动耗时及重启次数"""
+        if settings.FAVA_MODE == "wsgi":
+            return {"mode": "wsgi", "running": cls.is_running()}
+        process = cls._process
+        return {
+            "mode": "process",
+            "role": cls._role,
+            "running": cls.is_running(),
+            "stopped": cls._stop_requested(),
+            "pid": process.pid if process is not None and process.poll() is None else None,
+            "startup_latency": round(cls._startup_latency, 3) if cls._startup_latency is not None else None,
+            "restarts": cls._restarts,
+            "last_exit_code": cls._last_exit_code,
+        }
     
     @classmethod
     def get_url(cls, host: str = "localhost") -> str:
@@ -0,0 +1,186 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Tuple, Union
+from PIL import Image, ImageChops, ImageOps
+from ..config import settings
+
+_MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+
+def _strip_jpeg_metadata(data: bytes) -> Optional[bytes]:
+    """
+    删除 JPEG 中的 APP1-APP13、APP15（EXIF、XMP、ICC 等）和注释段，不重新编码
+
+    保留 APP0 (JFIF) 和 APP14 (Adobe，影响颜色变换)；无法识别的文件返回 None。
+    """
+    if data[:2] != b'\xff\xd8':
+        return None
+    parts = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # 段之间的填充字节
+            pos += 1
+            continue
+        if marker == 0xDA:
+            # 扫描数据开始，之后不再有元数据段
+            parts.append(data[pos:])
+            return b''.join(parts)
+        end = pos + 2 + int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if not (0xE1 <= marker <= 0xED or marker in (0xEF, 0xFE)):
+            parts.append(data[pos:end])
+        pos = end
+    return None
+
+
+@dataclass
+class PreparedImage:
+    """预处理后待上传给 VLM 的图片"""
+    data: bytes
+    media_type: str
+    original_format: str
+    original_bytes: int
+    processed_bytes: int
+    original_size: Tuple[int, int]
+    processed_size: Tuple[int, int]
+
+
+class ImagePreprocessor:
+    """
+    上传 VLM 前的图片预处理
+
+    识别真实格式、去除 EXIF 等元数据、裁掉纯色边缘、按最大边长缩放并重新压缩，
+    以减少上传字节数和图片 token。裁剪缩放后尺寸不变且已经足够小的图片（如截图），
+    以及重新压缩后没有变小的图片，改用同样去除了元数据的无损结果，避免引入 JPEG 压缩痕迹。
+    Pillow 解码和编码较耗 CPU，在线程池中执行。
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKER_THREADS, thread_name_prefix="image")
+
+    @classmethod
+    async def prepare(cls, image: Union[bytes, BinaryIO], original_bytes: int = 0) -> PreparedImage:
+        """在线程池中预处理图片"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._executor, cls.process, image, original_bytes)
+
+    @classmethod
+    def process(cls, image: Union[bytes, BinaryIO], original_bytes: int = 0) -> PreparedImage:
+        """
+        同步预处理图片
+
+        Args:
+            image: 图片字节或可读文件对象
+            original_bytes: 原始大小，传入文件对象时用于记录
+        """
+        if isinstance(image, (bytes, bytearray)):
+            original_bytes = len(image)
+            image = io.BytesIO(image)
+
+        try:
+            img = Image.open(image)
+            original_format = img.format or "UNKNOWN"
+            original_size = img.size
+            rotated = img.getexif().get(0x0112, 1) != 1
+            # JPEG 可在解码阶段直接降采样，大图时明显更快
+            img.draft('RGB', (settings.IMAGE_MAX_SIDE, settings.IMAGE_MAX_SIDE))
+            img = ImageOps.exif_transpose(img)
+        except Exception as e:
+            raise ValueError(f"Unsupported image: {e}")
+
+        img = cls._to_rgb(img)
+        img = cls._crop_margins(img)
+        img.thumbnail((settings.IMAGE_MAX_SIDE, settings.IMAGE_MAX_SIDE), Image.LANCZOS)
+        # 转换后的图片仍带着原图的 info，Pillow 保存时会写回其中的 icc_profile 等信息
+        img.info = {}
+        # 没有旋转、裁剪和缩放时，可以不经有损压缩直接使用原图的像素
+        unchanged = not rotated and img.size == original_size
+
+        if unchanged and 0 < original_bytes <= settings.IMAGE_KEEP_ORIGINAL_MAX_BYTES:
+            # 截图等已经足够小的图片不重新压缩，避免引入 JPEG 压缩痕迹
+            lossless = cls._lossless(img, image, original_format, unchanged)
+            if lossless is not None:
+                return cls._prepared(*lossless, img, original_format, original_bytes, original_size)
+
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=settings.IMAGE_JPEG_QUALITY, optimize=True)
+        data, processed_format = output.getvalue(), 'JPEG'
+        if 0 < original_bytes <= len(data):
+            # 重新压缩没有变小时，改用同样去除了元数据的无损结果（如果更小）
+            lossless = cls._lossless(img, image, original_format, unchanged)
+            if lossless is not None and len(lossless[0]) < len(data):
+                data, processed_format = lossless
+        return cls._prepared(data, processed_format, img, original_format, original_bytes, original_size)
+
+    @classmethod
+    def _lossless(cls, img: Image.Image, image: BinaryIO, original_format: str,
+                  unchanged: bool) -> Optional[Tuple[bytes, str]]:
+        """
+        不经有损压缩、去除元数据后的图片，不适用时返回 None
+
+        PNG 原图把处理后的图片重新保存为 PNG（不写入文本块和 ICC 等附加信息）；
+        JPEG 原图只在像素未改变时可用，直接删除原文件中的元数据段。
+        """
+        if original_format == 'PNG':
+            output = io.BytesIO()
+            img.save(output, format='PNG', optimize=True)
+            return output.getvalue(), 'PNG'
+        if original_format == 'JPEG' and unchanged:
+            image.seek(0)
+            data = _strip_jpeg_metadata(image.read())
+            if data is not None:
+                return data, 'JPEG'
+        return None
+
+    @staticmethod
+    def _prepared(data: bytes, processed_format: str, img: Image.Image, original_format: str,
+                  original_bytes: int, original_size: Tuple[int, int]) -> PreparedImage:
+        print(
+            f"Image preprocessed: {original_format} {original_size[0]}x{original_size[1]} {original_bytes}B"
+            f" -> {processed_format} {img.size[0]}x{img.size[1]} {len(data)}B"
+        )
+        return PreparedImage(
+            data=data,
+            media_type=_MEDIA_TYPES[processed_format],
+            original_format=original_format,
+            original_bytes=original_bytes,
+            processed_bytes=len(data),
+            original_size=original_size,
+            processed_size=img.size,
+        )
+
+    @staticmethod
+    def _to_rgb(img: Image.Image) -> Image.Image:
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            # 透明背景合成到白底上
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            return background
+        return img.convert('RGB')
+
+    @staticmethod
+    def _crop_margins(img: Image.Image) -> Image.Image:
+        """以左上角像素为背景色，裁掉四周与之接近的纯色边缘"""
+        background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+        diff = ImageChops.difference(img, background).convert('L')
+        threshold = settings.IMAGE_CROP_THRESHOLD
+        bbox = diff.point(lambda p: 255 if p > threshold else 0).getbbox()
+        if not bbox:
+            return img
+
+        padding = 8
+        left, top, right, bottom = bbox
+        bbox = (
+            max(left - padding, 0),
+            max(top - padding, 0),
+            min(right + padding, img.width),
+            min(bottom + padding, img.height),
+        )
+        if bbox == (0, 0, img.width, img.height):
+            return img
+        return img.crop(bbox)
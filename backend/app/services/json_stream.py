@@ -0,0 +1,86 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONObjectParser:
+    """
+    增量解析模型流式输出的 JSON 对象
+
+    每次 feed 一段文本，返回其中新完成的顶层字段 (key, value)。
+    对象之前的内容（如 ```json 标记）会被忽略。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = -1  # 下一个待解析字段的起始位置，-1 表示尚未找到 '{'
+        self.result: Dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buffer += text
+        completed = []
+        if self.done:
+            return completed
+
+        if self._pos < 0:
+            start = self._buffer.find("{")
+            if start < 0:
+                return completed
+            self._pos = start + 1
+
+        while True:
+            member = self._parse_member(self._pos)
+            if member is None:
+                break
+            key, value, end = member
+            if key is None:
+                self.done = True
+                break
+            self.result[key] = value
+            completed.append((key, value))
+            self._pos = end
+        return completed
+
+    def _skip(self, pos: int, chars: str) -> int:
+        while pos < len(self._buffer) and self._buffer[pos] in chars:
+            pos += 1
+        return pos
+
+    def _parse_member(self, pos: int):
+        """解析一个完整字段，数据不足时返回 None，遇到对象结束时 key 为 None"""
+        buffer = self._buffer
+        pos = self._skip(pos, _WHITESPACE + ",")
+        if pos >= len(buffer):
+            return None
+        if buffer[pos] == "}":
+            return None, None, pos + 1
+        if buffer[pos] != '"':
+            raise ValueError(f"Unexpected character in JSON object: {buffer[pos]!r}")
+
+        try:
+            key, pos = json.decoder.scanstring(buffer, pos + 1)
+        except json.JSONDecodeError:
+            return None
+
+        pos = self._skip(pos, _WHITESPACE)
+        if pos >= len(buffer):
+            return None
+        if buffer[pos] != ":":
+            raise ValueError(f"Expected ':' after key {key!r}")
+        pos = self._skip(pos + 1, _WHITESPACE)
+        if pos >= len(buffer):
+            return None
+
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            return None
+        # 数字可能在块边界处被截断（如 "25." 或 "1e"），后面出现 ',' 或 '}' 时才能确定已经完整
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            follow = self._skip(end, _WHITESPACE)
+            if follow >= len(buffer) or buffer[follow] not in ",}":
+                return None
+        return key, value, end
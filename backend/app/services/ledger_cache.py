@@ -0,0 +1,301 @@
+import asyncio
+import bisect
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Tuple
+from beancount import loader
+from beancount.core import data
+from ..config import settings
+from ..utils.file_lock import locked_file
+
+# (文件路径, mtime_ns, 文件大小)
+FileSignature = Tuple[Tuple[str, int, int], ...]
+
+
+def _fingerprint(signature: FileSignature) -> str:
+    return hashlib.sha256(repr(signature).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class LedgerSnapshot:
+    """某一版本账本的解析结果，所有读取接口共享"""
+    version: int
+    # 最近一次完整解析得到的条目，各版本共享且不会修改；包含追加交易的完整列表见 entries
+    base_entries: list
+    errors: list
+    options: dict
+    signature: FileSignature
+    accounts: List[str] = field(default_factory=list)
+    # 最近一次完整解析的版本，以及此后本进程追加的交易（列表只追加，由各版本共享）
+    base_version: int = 0
+    appended: list = field(default_factory=list)
+    appended_count: int = 0
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        由文件签名得到的账本指纹
+
+        与进程内的版本号不同，多个 worker 对磁盘上同一份账本得到相同的指纹，可用于 ETag。
+        """
+        return _fingerprint(self.signature)
+
+    def appended_since(self, count: int) -> list:
+        """返回本版本中第 count 笔之后追加的交易"""
+        return self.appended[count:self.appended_count]
+
+    @cached_property
+    def entries(self) -> list:
+        """
+        按日期排序的全部条目，首次读取时才把追加的交易合并进来
+
+        追加写入时不复制或排序整个列表，写入开销只与追加的笔数有关；
+        只有需要全量条目的读取方（如重建索引）才付出合并的开销，每个版本最多一次。
+        """
+        tail = sorted(self.appended_since(0), key=data.entry_sortkey)
+        if not tail:
+            return self.base_entries
+        base = self.base_entries
+        merged = []
+        start = 0
+        for entry in tail:
+            i = bisect.bisect_right(base, data.entry_sortkey(entry), lo=start, key=data.entry_sortkey)
+            merged.extend(base[start:i])
+            merged.append(entry)
+            start = i
+        merged.extend(base[start:])
+        return merged
+
+
+class LedgerCache:
+    """
+    进程级账本缓存
+
+    以主文件及所有 include 文件的 mtime 和大小作为键，
+    只有其中任意文件发生变化时才重新解析，每次重新解析后版本号单调递增。
+    """
+
+    _lock = threading.Lock()
+    _snapshot: Optional[LedgerSnapshot] = None
+    _version: int = 0
+
+    # 解析和 realize 是 CPU 密集的同步操作，放到专用线程池中执行，避免阻塞事件循环
+    _executor = ThreadPoolExecutor(max_workers=settings.LEDGER_WORKER_THREADS, thread_name_prefix="ledger")
+    # 正在执行的加载任务，同一时刻的并发请求共享同一次解析
+    _inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _stat_files(paths) -> FileSignature:
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                # 文件被删除也视为变化
+                signature.append((path, -1, -1))
+        return tuple(signature)
+
+    @classmethod
+    def _tracked_files(cls) -> List[str]:
+        if cls._snapshot is None:
+            return [os.path.abspath(settings.BEANCOUNT_MAIN_PATH)]
+        return [path for path, _, _ in cls._snapshot.signature]
+
+    @classmethod
+    def is_fresh(cls) -> bool:
+        """缓存是否与磁盘上的账本文件一致"""
+        snapshot = cls._snapshot
+        if snapshot is None:
+            return False
+        return cls._stat_files(cls._tracked_files()) == snapshot.signature
+
+    @classmethod
+    def current_fingerprint(cls) -> Optional[str]:
+        """
+        不解析账本，由已知文件的当前状态得到指纹
+
+        文件未变化时与快照的 fingerprint 相同；本进程尚未解析过账本（不知道 include 了哪些文件）时返回 None。
+        """
+        if cls._snapshot is None:
+            return None
+        return _fingerprint(cls._stat_files(cls._tracked_files()))
+
+    @classmethod
+    def get(cls) -> LedgerSnapshot:
+        """获取当前账本快照，文件未变化时直接返回缓存"""
+        with cls._lock:
+            if cls.is_fresh():
+                return cls._snapshot
+            return cls._reload()
+
+    @classmethod
+    def stat_file(cls, path: str) -> Tuple[int, int]:
+        """返回文件当前的 (mtime_ns, size)"""
+        _, mtime, size = cls._stat_files([os.path.abspath(path)])[0]
+        return mtime, size
+
+    @classmethod
+    def record_append(cls, path: str, entries: List[data.Transaction],
+                      stat_before: Tuple[int, int], stat_after: Tuple[int, int]):
+        """
+        应用本进程追加写入的交易，避免为几笔记录重新解析整个账本
+
+        只有写入前文件状态与缓存记录一致（即期间没有外部修改）时才增量更新，
+        否则保持原签名不变，下次读取时会发现文件变化并完整重新解析。
+        """
+        path = os.path.abspath(path)
+        with cls._lock:
+            snapshot = cls._snapshot
+            if snapshot is None:
+                return
+            tracked = {p: (mtime, size) for p, mtime, size in snapshot.signature}
+            if tracked.get(path) != stat_before:
+                return
+
+            signature = tuple(
+                (p, *stat_after) if p == path else (p, mtime, size)
+                for p, mtime, size in snapshot.signature
+            )
+            snapshot.appended.extend(entries)
+            cls._version += 1
+            cls._snapshot = replace(
+                snapshot,
+                version=cls._version,
+                signature=signature,
+                appended_count=snapshot.appended_count + len(entries),
+            )
+
+    @classmethod
+    async def aget(cls) -> LedgerSnapshot:
+        """get() 的异步版本，缓存命中时不进入线程池"""
+        snapshot = cls._snapshot
+        if snapshot is not None and cls.is_fresh():
+            return snapshot
+        return await cls._run_shared("snapshot", cls.get)
+
+    @classmethod
+    async def _run_shared(cls, key: str, func: Callable):
+        future = cls._inflight.get(key)
+        if future is None or future.done():
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(cls._executor, func)
+            cls._inflight[key] = future
+
+            def _clear(done, key=key):
+                if cls._inflight.get(key) is done:
+                    del cls._inflight[key]
+
+            future.add_done_callback(_clear)
+        # shield: 单个调用方被取消时不影响其他等待同一次解析的调用方
+        return await asyncio.shield(future)
+
+    @classmethod
+    async def run_in_executor(cls, func: Callable, *args):
+        """在解析线程池中执行与账本相关的 CPU 密集操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls._executor, func, *args)
+
+    @classmethod
+    def shutdown(cls):
+        """关闭解析线程池"""
+        cls._executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def invalidate(cls):
+        """丢弃缓存，下次读取时强制重新解析"""
+        with cls._lock:
+            cls._snapshot = None
+
+    @staticmethod
+    @contextmanager
+    def _shared_lock(path: str):
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            yield
+            return
+        with f, locked_file(f, shared=True):
+            yield
+
+    @classmethod
+    def _reload(cls) -> LedgerSnapshot:
+        main_path = os.path.abspath(settings.BEANCOUNT_MAIN_PATH)
+        # 持有交易文件的共享锁，避免读到其他进程写了一半的交易
+        with cls._shared_lock(settings.BEANCOUNT_TRANSACTION_PATH):
+            # 解析前先记录文件状态，解析期间发生的修改会在下次检查时被发现
+            before = {path: (mtime, size) for path, mtime, size in cls._stat_files(cls._tracked_files())}
+
+            entries, errors, options = loader.load_file(main_path)
+
+        files = [main_path]
+        for path in options.get("include") or []:
+            path = os.path.abspath(path)
+            if path not in files:
+                files.append(path)
+
+        signature = []
+        for path, mtime, size in cls._stat_files(files):
+            if path in before:
+                mtime, size = before[path]
+            signature.append((path, mtime, size))
+
+        accounts = sorted({entry.account for entry in entries if isinstance(entry, data.Open)})
+
+        cls._version += 1
+        cls._snapshot = LedgerSnapshot(
+            version=cls._version,
+            base_entries=entries,
+            errors=errors,
+            options=options,
+            signature=tuple(signature),
+            accounts=accounts,
+            base_version=cls._version,
+        )
+        print(f"Ledger loaded: version={cls._version}, entries={len(entries)}, files={len(files)}")
+        return cls._snapshot
+
+
+class DerivedIndex:
+    """
+    随账本版本维护的派生索引基类
+
+    账本完整重新解析后调用 rebuild 全量重建，
+    仅有本进程追加的交易时调用 update 增量更新，子类实现这两个方法。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._base_version = 0
+        self._applied = 0
+
+    def rebuild(self, entries: list):
+        raise NotImplementedError
+
+    def update(self, entries: list):
+        raise NotImplementedError
+
+    def refresh(self, snapshot: LedgerSnapshot):
+        """同步到指定版本的账本"""
+        with self._lock:
+            if self.version == snapshot.version:
+                return
+            if self.version and self._base_version == snapshot.base_version and self._applied <= snapshot.appended_count:
+                self.update(snapshot.appended_since(self._applied))
+            else:
+                self.rebuild(snapshot.entries)
+                self._base_version = snapshot.base_version
+            self._applied = snapshot.appended_count
+            self.version = snapshot.version
+
+    async def arefresh(self):
+        """同步到当前账本，需要重建时在解析线程池中执行"""
+        snapshot = await LedgerCache.aget()
+        if self.version != snapshot.version:
+            await LedgerCache.run_in_executor(self.refresh, snapshot)
@@ -0,0 +1,95 @@
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional
+from beancount.core import data
+from ..config import settings
+
+
+@dataclass
+class PendingTransaction:
+    """等待写入账本的一笔交易"""
+    text: str
+    entry: data.Transaction
+
+
+class LedgerWriter:
+    """
+    单写者追加队列（group commit）
+
+    所有请求把待写入的交易放入队列，由唯一的写入任务把一个时间窗口内的交易
+    合并为一次加锁写入和 fsync，写入持久化后才通知各个调用方。
+    """
+
+    _queue: Optional[asyncio.Queue] = None
+    _task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def start(cls):
+        """启动写入任务（需在事件循环中调用）"""
+        if cls._task is not None and not cls._task.done():
+            return
+        cls._queue = asyncio.Queue()
+        cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls):
+        """写完队列中剩余的交易后停止写入任务"""
+        if cls._task is None:
+            return
+        await cls._queue.put(None)
+        await cls._task
+        cls._task = None
+        cls._queue = None
+
+    @classmethod
+    async def submit(cls, items: List[PendingTransaction]):
+        """提交一组交易，在其所在批次写入并 fsync 后返回，失败时抛出异常"""
+        if not items:
+            return
+        cls.start()
+        future = asyncio.get_running_loop().create_future()
+        await cls._queue.put((items, future))
+        await future
+
+    @classmethod
+    async def _run(cls):
+        from .beancount_ops import get_beancount_service
+
+        loop = asyncio.get_running_loop()
+        window = settings.LEDGER_WRITE_WINDOW_MS / 1000
+        stopping = False
+        while not stopping:
+            request = await cls._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            count = len(request[0])
+
+            # 在时间窗口内继续收集后续请求，合并为同一次写入
+            deadline = loop.time() + window
+            while count < settings.LEDGER_WRITE_MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(cls._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                count += len(request[0])
+
+            items = [item for pending, _ in batch for item in pending]
+            try:
+                await loop.run_in_executor(None, get_beancount_service().write_transactions, items)
+            except Exception as e:
+                print(f"Error writing transaction batch: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
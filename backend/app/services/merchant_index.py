@@ -0,0 +1,105 @@
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Optional
+from beancount.core import data
+from .ledger_cache import DerivedIndex
+from ..config import settings
+
+
+@dataclass
+class MerchantMatch:
+    """某商家在历史账本中最常用的分类账户和支付账户"""
+    count: int
+    category_account: str
+    category_confidence: float
+    payment_account: str
+    payment_confidence: float
+
+
+def normalize_merchant(name: str) -> str:
+    return "".join(unicodedata.normalize("NFKC", name or "").split()).lower()
+
+
+class MerchantIndex(DerivedIndex):
+    """
+    商家 -> 分类/支付账户索引
+
+    以交易的 payee（为空时用 narration）为键，统计与之搭配的
+    支出/收入账户和资产/负债账户，对应 append_transaction 写入的格式。
+    """
+
+    def __init__(self):
+        super().__init__()
+        # 重建在线程池中进行，查询只需短暂持有该锁
+        self._data_lock = threading.Lock()
+        self._categories: Dict[str, Counter] = defaultdict(Counter)
+        self._payments: Dict[str, Counter] = defaultdict(Counter)
+
+    def rebuild(self, entries: list):
+        categories, payments = defaultdict(Counter), defaultdict(Counter)
+        self._count(entries, categories, payments)
+        with self._data_lock:
+            self._categories, self._payments = categories, payments
+        print(f"Merchant index built: merchants={len(categories)}")
+
+    def update(self, entries: list):
+        with self._data_lock:
+            self._count(entries, self._categories, self._payments)
+
+    @staticmethod
+    def _count(entries: list, categories: Dict[str, Counter], payments: Dict[str, Counter]):
+        for entry in entries:
+            if not isinstance(entry, data.Transaction):
+                continue
+            key = normalize_merchant(entry.payee or entry.narration)
+            if not key:
+                continue
+            for posting in entry.postings:
+                root = posting.account.split(":", 1)[0]
+                if root in ("Expenses", "Income"):
+                    categories[key][posting.account] += 1
+                elif root in ("Assets", "Liabilities"):
+                    payments[key][posting.account] += 1
+
+    def lookup(self, merchant: str) -> Optional[MerchantMatch]:
+        """
+        查找商家的常用账户，样本数不足或账户不够集中时返回 None
+
+        Args:
+            merchant: 商家名称
+        """
+        key = normalize_merchant(merchant)
+        with self._data_lock:
+            categories = self._categories.get(key)
+            if not categories:
+                return None
+            total = sum(categories.values())
+            category_account, category_count = categories.most_common(1)[0]
+            payments = self._payments.get(key)
+            payment_total = sum(payments.values()) if payments else 0
+            payment_account, payment_count = payments.most_common(1)[0] if payments else ("", 0)
+
+        if total < settings.MERCHANT_MIN_COUNT:
+            return None
+        match = MerchantMatch(
+            count=total,
+            category_account=category_account,
+            category_confidence=category_count / total,
+            payment_account=payment_account,
+            payment_confidence=payment_count / payment_total if payment_total else 0.0,
+        )
+        if match.category_confidence < settings.MERCHANT_MIN_CONFIDENCE:
+            return None
+        return match
+
+
+_index: Optional[MerchantIndex] = None
+
+
+def get_merchant_index() -> MerchantIndex:
+    global _index
+    if _index is None:
+        _index = MerchantIndex()
+    return _index
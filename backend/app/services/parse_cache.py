@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+from ..config import settings
+
+if TYPE_CHECKING:
+    from .prompts import Prompt
+
+
+class ParseCache:
+    """
+    内容寻址的解析结果缓存
+
+    键由输入内容（图片字节或规范化后的文本）的哈希、prompt 版本和模型共同决定，
+    内存中为带 TTL 的 LRU，可选地落盘到 PARSE_CACHE_DIR 以便重启后继续命中；
+    落盘文件过期后在读取时删除，另由后台线程定期清理从未再被读取的过期文件。
+    """
+
+    _entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+    _lock = threading.Lock()
+    _last_sweep: float = 0.0
+
+    @staticmethod
+    def digest_bytes(payload: bytes) -> str:
+        return hashlib.sha256(payload).hexdigest()
+
+    @staticmethod
+    def digest_text(text: str) -> str:
+        # 全半角统一、去除首尾及连续空白，使等价输入得到相同的键
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(kind: str, digest: str, prompt: "Prompt", model: str) -> str:
+        """
+        生成缓存键
+
+        Args:
+            kind: "image" 或 "text"
+            digest: 输入内容的哈希
+            prompt: 本次使用的 prompt，固定前缀的内容即 prompt 版本
+            model: 提供商及模型名
+
+        后缀中的当前日期只对文本计入键：文本里的“昨天”等相对日期依赖当天日期，
+        图片的结果由截图内容决定，跨天仍可命中，使 PARSE_CACHE_TTL 真正生效。
+        """
+        version = prompt.text if kind == "text" else prompt.prefix
+        prompt_digest = hashlib.sha256(version.encode("utf-8")).hexdigest()
+        raw = f"{kind}\0{digest}\0{prompt_digest}\0{model}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get(cls, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with cls._lock:
+            item = cls._entries.get(key)
+            if item is not None:
+                created, result = item
+                if now - created < settings.PARSE_CACHE_TTL:
+                    cls._entries.move_to_end(key)
+                    return dict(result)
+                del cls._entries[key]
+
+        item = cls._read_disk(key)
+        if item is None:
+            return None
+        created, result = item
+        if now - created >= settings.PARSE_CACHE_TTL:
+            cls._remove_disk(cls._disk_path(key))
+            return None
+        cls._remember(key, created, result)
+        return dict(result)
+
+    @classmethod
+    def put(cls, key: str, result: Dict[str, Any]):
+        created = time.time()
+        cls._remember(key, created, result)
+        cls._write_disk(key, created, result)
+        cls._maybe_sweep(created)
+
+    @classmethod
+    def _remember(cls, key: str, created: float, result: Dict[str, Any]):
+        with cls._lock:
+            cls._entries[key] = (created, dict(result))
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > settings.PARSE_CACHE_SIZE:
+                cls._entries.popitem(last=False)
+
+    @staticmethod
+    def _disk_path(key: str) -> Optional[str]:
+        if not settings.PARSE_CACHE_DIR:
+            return None
+        return os.path.join(settings.PARSE_CACHE_DIR, key[:2], f"{key}.json")
+
+    @classmethod
+    def _read_disk(cls, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = cls._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                item = json.load(f)
+            return item["created"], item["result"]
+        except Exception as e:
+            print(f"Failed to read parse cache {path}: {e}")
+            return None
+
+    @classmethod
+    def _write_disk(cls, key: str, created: float, result: Dict[str, Any]):
+        path = cls._disk_path(key)
+        if path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读到半个文件
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"created": created, "result": result}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Failed to write parse cache {path}: {e}")
+
+    @staticmethod
+    def _remove_disk(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to remove parse cache {path}: {e}")
+
+    @classmethod
+    def _maybe_sweep(cls, now: float):
+        """距上次清理超过 PARSE_CACHE_SWEEP_INTERVAL 时在后台线程中清理落盘目录"""
+        if not settings.PARSE_CACHE_DIR:
+            return
+        with cls._lock:
+            if now - cls._last_sweep < settings.PARSE_CACHE_SWEEP_INTERVAL:
+                return
+            cls._last_sweep = now
+        threading.Thread(target=cls.sweep, name="parse-cache-sweep", daemon=True).start()
+
+    @classmethod
+    def sweep(cls) -> int:
+        """
+        删除落盘目录中的过期文件及残留的临时文件，返回删除的文件数
+
+        文件只在写入时修改一次，用 mtime 判断是否过期，不需要读取内容。
+        """
+        root = settings.PARSE_CACHE_DIR
+        if not root or not os.path.isdir(root):
+            return 0
+        deadline = time.time() - settings.PARSE_CACHE_TTL
+        removed = 0
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if not name.endswith((".json", ".tmp")):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    expired = os.stat(path).st_mtime < deadline
+                except OSError:
+                    continue
+                if expired:
+                    cls._remove_disk(path)
+                    removed += 1
+        if removed:
+            print(f"Parse cache sweep: removed {removed} expired files")
+        return removed
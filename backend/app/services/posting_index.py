@@ -0,0 +1,206 @@
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+from beancount.core import data
+from .ledger_cache import DerivedIndex
+from .merchant_index import normalize_merchant
+
+# (日期序数, 内容摘要, 内容相同的交易的序号)
+# 只由交易内容决定，重新解析账本或换到其他 worker 后同一笔交易的键不变，可以作为翻页游标
+TransactionKey = Tuple[int, str, int]
+
+
+@dataclass
+class TransactionQuery:
+    """交易查询条件，None 表示不限"""
+    start: Optional[date] = None
+    end: Optional[date] = None
+    account: Optional[str] = None
+    payee: Optional[str] = None
+    min_amount: Optional[Decimal] = None
+    max_amount: Optional[Decimal] = None
+    cursor: Optional[str] = None
+    limit: int = 50
+
+
+def transaction_digest(entry: data.Transaction) -> str:
+    """交易内容的摘要，不含文件名和行号（本进程追加的交易没有真实行号）"""
+    parts = [
+        entry.date.isoformat(), entry.flag or "", entry.payee or "", entry.narration or "",
+        " ".join(sorted(entry.tags or ())), " ".join(sorted(entry.links or ())),
+    ]
+    parts.extend(f"{posting.account} {posting.units}" for posting in entry.postings)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(key: TransactionKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> TransactionKey:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ordinal, digest, n = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(digest, str):
+            raise TypeError(digest)
+        return int(ordinal), digest, int(n)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class PostingIndex(DerivedIndex):
+    """
+    交易查询索引
+
+    所有交易按 (日期, 内容摘要) 排序，日期范围和游标用二分查找定位；
+    另按账户和规范化后的 payee 维护各自有序的键列表，按账户前缀或 payee 子串查询时
+    只合并命中的列表，并且只读取当前页需要的条目。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._data_lock = threading.Lock()
+        self._keys: List[TransactionKey] = []
+        self._entries: Dict[TransactionKey, data.Transaction] = {}
+        self._by_account: Dict[str, List[TransactionKey]] = defaultdict(list)
+        self._by_payee: Dict[str, List[TransactionKey]] = defaultdict(list)
+
+    @staticmethod
+    def _key(entry: data.Transaction, entries: Dict[TransactionKey, data.Transaction]) -> TransactionKey:
+        """生成交易的键，内容完全相同的交易依次编号"""
+        ordinal, digest = entry.date.toordinal(), transaction_digest(entry)
+        n = 0
+        while (ordinal, digest, n) in entries:
+            n += 1
+        return ordinal, digest, n
+
+    def rebuild(self, entries: list):
+        by_key = {}
+        for entry in entries:
+            if isinstance(entry, data.Transaction):
+                by_key[self._key(entry, by_key)] = entry
+        keys = sorted(by_key)
+        by_account = defaultdict(list)
+        by_payee = defaultdict(list)
+        for key in keys:
+            entry = by_key[key]
+            # 按键的顺序遍历，直接追加即可保持各列表有序
+            for account in {posting.account for posting in entry.postings}:
+                by_account[account].append(key)
+            by_payee[self._payee_key(entry)].append(key)
+        with self._data_lock:
+            self._keys, self._entries = keys, by_key
+            self._by_account, self._by_payee = by_account, by_payee
+        print(f"Posting index built: transactions={len(keys)}, accounts={len(by_account)}")
+
+    def update(self, entries: list):
+        with self._data_lock:
+            for entry in entries:
+                if not isinstance(entry, data.Transaction):
+                    continue
+                key = self._key(entry, self._entries)
+                self._entries[key] = entry
+                # 新交易通常日期最新，insort 接近于追加
+                bisect.insort(self._keys, key)
+                for account in {posting.account for posting in entry.postings}:
+                    bisect.insort(self._by_account[account], key)
+                bisect.insort(self._by_payee[self._payee_key(entry)], key)
+
+    @staticmethod
+    def _payee_key(entry: data.Transaction) -> str:
+        return normalize_merchant(entry.payee or entry.narration)
+
+    @staticmethod
+    def _account_matches(account: str, prefix: str) -> bool:
+        return account == prefix or account.startswith(prefix + ":")
+
+    @staticmethod
+    def _iter_desc(keys: List[TransactionKey], lo: TransactionKey, hi: TransactionKey) -> Iterator[TransactionKey]:
+        """按从新到旧的顺序遍历 lo <= key < hi 的键，不复制列表"""
+        start = bisect.bisect_left(keys, lo)
+        stop = bisect.bisect_left(keys, hi)
+        for i in range(stop - 1, start - 1, -1):
+            yield keys[i]
+
+    def _amount_matches(self, entry: data.Transaction, query: TransactionQuery) -> bool:
+        """任一（账户前缀命中的）分录金额绝对值落在范围内即匹配"""
+        for posting in entry.postings:
+            if posting.units is None or posting.units.number is None:
+                continue
+            if query.account and not self._account_matches(posting.account, query.account):
+                continue
+            number = abs(posting.units.number)
+            if query.min_amount is not None and number < query.min_amount:
+                continue
+            if query.max_amount is not None and number > query.max_amount:
+                continue
+            return True
+        return False
+
+    def search(self, query: TransactionQuery) -> Tuple[List[Tuple[str, data.Transaction]], Optional[str]]:
+        """
+        按条件查询交易，从新到旧返回一页
+
+        Returns:
+            ([(交易 ID, 交易)], 下一页游标)，没有更多结果时游标为 None；
+            交易 ID 本身也是游标，从该交易之后继续查询
+
+        Raises:
+            ValueError: 游标无效，或对应的交易已不在账本中
+        """
+        lo: TransactionKey = (query.start.toordinal(), "", -1) if query.start else (0, "", -1)
+        hi: TransactionKey = (query.end.toordinal() + 1, "", -1) if query.end else (date.max.toordinal() + 1, "", -1)
+        cursor = decode_cursor(query.cursor) if query.cursor else None
+        payee = normalize_merchant(query.payee) if query.payee else ""
+
+        with self._data_lock:
+            if cursor is not None:
+                if cursor not in self._entries:
+                    raise ValueError("Cursor no longer matches a transaction in the ledger")
+                hi = min(hi, cursor)
+            if payee:
+                lists = [keys for name, keys in self._by_payee.items() if payee in name]
+            elif query.account:
+                lists = [keys for account, keys in self._by_account.items()
+                         if self._account_matches(account, query.account)]
+            else:
+                lists = [self._keys]
+            candidates = heapq.merge(*(self._iter_desc(keys, lo, hi) for keys in lists), reverse=True)
+
+            results = []
+            last_key = None
+            for key in candidates:
+                if key == last_key:
+                    # 同一交易的多个分录命中同一账户前缀
+                    continue
+                last_key = key
+                entry = self._entries[key]
+                if payee and query.account and not any(
+                    self._account_matches(posting.account, query.account) for posting in entry.postings
+                ):
+                    continue
+                if (query.min_amount is not None or query.max_amount is not None) \
+                        and not self._amount_matches(entry, query):
+                    continue
+                if len(results) == query.limit:
+                    return results, results[-1][0]
+                results.append((encode_cursor(key), entry))
+        return results, None
+
+
+_index: Optional[PostingIndex] = None
+
+
+def get_posting_index() -> PostingIndex:
+    global _index
+    if _index is None:
+        _index = PostingIndex()
+    return _index
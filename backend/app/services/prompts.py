@@ -1,16 +1,31 @@
+from dataclasses import dataclass
 from ..utils.datetime_utils import get_beijing_date_str
 
 
-def get_image_parse_prompt() -> str:
-    current_date = get_beijing_date_str()
-    return f"""请分析账单截图，严格按照以下JSON格式返回。
+@dataclass(frozen=True)
+class Prompt:
+    """
+    拆分为固定前缀和可变后缀的 prompt
+
+    前缀（规则、白名单、示例）每次请求完全相同，可被提供商的 prompt cache 命中；
+    后缀只包含日期等每次变化的内容，放在前缀之后。
+    """
+    prefix: str
+    suffix: str
+
+    @property
+    def text(self) -> str:
+        return f"{self.prefix}\n\n{self.suffix}"
+
+
+IMAGE_PARSE_PROMPT_PREFIX = """请分析账单截图，严格按照以下JSON格式返回。
 
 ### 核心规则（违反将导致记账失败）：
 1. **分类唯一性**：`category` 必须【百分之百】匹配下方列表。禁止返回“餐饮美食”、“交通出行”等列表外词汇。
 2. **逻辑推断**：如果商家是“肯德基”且时间在11:00-14:00，category="午餐"；若无时间，默认选“午餐”。
 3. **输出格式**：只返回纯JSON字符串，严禁包含任何Markdown标签（如 ```json）或解释性文字。
 
-{{
+{
   "date": "YYYY-MM-DD",
   "amount": 0.0,
   "merchant": "",
@@ -20,7 +35,7 @@ def get_image_parse_prompt() -> str:
   "transaction_type": "expense/income",
   "category": "必须从预设列表中选择",
   "description": ""
-}}
+}
 
 ### 预设分类白名单（禁止超出此范围）：
 - 餐饮类：早餐, 午餐, 晚餐, 零食, 买菜
@@ -40,20 +55,14 @@ def get_image_parse_prompt() -> str:
 - 识别到商家“美团外卖” -> 检查时间 -> 返回 "午餐" (不可返回"外卖")
 - 识别到商家“全家便利店” -> 返回 "零食" (不可返回"便利店")
 - 识别到商家“滴滴” -> 返回 "打车" (不可返回"交通出行")
+- 截图中没有日期时，使用末尾给出的今天日期"""
 
-今天日期是：{current_date}"""
-
-
-def get_text_parse_prompt() -> str:
-    """生成文本解析prompt，包含当前日期"""
-    current_date = get_beijing_date_str()
-    return f"""请解析用户的记账文本，提取以下信息并以JSON格式返回。
 
-当前北京时间（UTC+8）：{current_date}
+TEXT_PARSE_PROMPT_PREFIX = """请解析用户的记账文本，提取以下信息并以JSON格式返回。
 
 返回格式：
-{{
-  "date": "YYYY-MM-DD格式的日期（如果用户没提供，使用今天{current_date}）",
+{
+  "date": "YYYY-MM-DD格式的日期（如果用户没提供，使用末尾给出的今天日期）",
   "amount": 金额（数字），
   "merchant": "商家名称或描述",
   "payment_method": "支付方式（支付宝/微信/现金/银行卡）",
@@ -62,7 +71,7 @@ def get_text_parse_prompt() -> str:
   "transaction_type": "expense或income",
   "category": "精确分类（见下方列表）",
   "description": "简短描述"
-}}
+}
 
 【支付方式识别规则】
 1. 支付宝/宝 → payment_method="支付宝"
@@ -108,24 +117,35 @@ def get_text_parse_prompt() -> str:
 - 挂号/医院/看病 → 看病
 - 红包/礼金/随礼 → 红包
 
-【解析示例】
+【解析示例】（示例中假设今天是2026-01-15）
 输入："午餐 25 微信"
-输出：{{"date": "{current_date}", "amount": 25, "merchant": "午餐", "payment_method": "微信", "bank_name": "", "card_last_four": "", "transaction_type": "expense", "category": "午餐", "description": "午餐"}}
+输出：{"date": "2026-01-15", "amount": 25, "merchant": "午餐", "payment_method": "微信", "bank_name": "", "card_last_four": "", "transaction_type": "expense", "category": "午餐", "description": "午餐"}
 
 输入："工资 8000 建行0388"
-输出：{{"date": "{current_date}", "amount": 8000, "merchant": "工资", "payment_method": "银行卡", "bank_name": "CCB", "card_last_four": "0388", "transaction_type": "income", "category": "工资", "description": "工资"}}
+输出：{"date": "2026-01-15", "amount": 8000, "merchant": "工资", "payment_method": "银行卡", "bank_name": "CCB", "card_last_four": "0388", "transaction_type": "income", "category": "工资", "description": "工资"}
 
 输入："滴滴打车 35 中行8735"
-输出：{{"date": "{current_date}", "amount": 35, "merchant": "滴滴打车", "payment_method": "银行卡", "bank_name": "BOC", "card_last_four": "8735", "transaction_type": "expense", "category": "打车", "description": "滴滴打车"}}
+输出：{"date": "2026-01-15", "amount": 35, "merchant": "滴滴打车", "payment_method": "银行卡", "bank_name": "BOC", "card_last_four": "8735", "transaction_type": "expense", "category": "打车", "description": "滴滴打车"}
 
 输入："买菜 68.5 支付宝"
-输出：{{"date": "{current_date}", "amount": 68.5, "merchant": "买菜", "payment_method": "支付宝", "bank_name": "", "card_last_four": "", "transaction_type": "expense", "category": "买菜", "description": "买菜"}}
+输出：{"date": "2026-01-15", "amount": 68.5, "merchant": "买菜", "payment_method": "支付宝", "bank_name": "", "card_last_four": "", "transaction_type": "expense", "category": "买菜", "description": "买菜"}
 
 输入："星巴克 45 工行4969"
-输出：{{"date": "{current_date}", "amount": 45, "merchant": "星巴克", "payment_method": "银行卡", "bank_name": "ICBC", "card_last_four": "4969", "transaction_type": "expense", "category": "零食", "description": "星巴克"}}
+输出：{"date": "2026-01-15", "amount": 45, "merchant": "星巴克", "payment_method": "银行卡", "bank_name": "ICBC", "card_last_four": "4969", "transaction_type": "expense", "category": "零食", "description": "星巴克"}
 
 【重要要求】
 1. category必须从列表中选择，优先选择最精确的分类
 2. 银行卡支付必须识别bank_name和card_last_four
 3. 智能推断：如果用户没说支付方式，根据常识推断（如工资通常是银行卡）
 4. 只返回纯JSON对象，不要markdown代码块，不要其他文字"""
+
+
+def get_image_parse_prompt() -> Prompt:
+    current_date = get_beijing_date_str()
+    return Prompt(prefix=IMAGE_PARSE_PROMPT_PREFIX, suffix=f"今天日期是：{current_date}")
+
+
+def get_text_parse_prompt() -> Prompt:
+    """生成文本解析prompt，日期放在可变后缀中"""
+    current_date = get_beijing_date_str()
+    return Prompt(prefix=TEXT_PARSE_PROMPT_PREFIX, suffix=f"当前北京时间（UTC+8）：{current_date}")
@@ -0,0 +1,288 @@
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from beancount.core import data
+from .ledger_cache import DerivedIndex
+
+# 列名及类型，每行对应一个支出/收入分录
+_COLUMNS = (
+    ("day", np.int32),       # 日期序数
+    ("month", np.int32),     # year * 12 + month - 1
+    ("kind", np.int8),       # KINDS 中的值
+    ("amount", np.float64),  # 支出为正，退款为负；收入同样以正数计
+    ("account", np.int32),   # 分类账户编码
+    ("payment", np.int32),   # 同一交易中第一个资产/负债账户的编码
+    ("merchant", np.int32),  # payee（为空时用 narration）编码
+)
+KINDS = {"expense": 0, "income": 1}
+# 物化月汇总的维度；商家数量多且只用于排行，直接在列存上统计
+ROLLUP_DIMENSIONS = ("account", "payment")
+GRANULARITIES = ("day", "week", "month")
+
+
+def _month_of(day: date) -> int:
+    return day.year * 12 + day.month - 1
+
+
+def format_bucket(bucket: int, granularity: str) -> str:
+    """时间桶的显示名称：日/周为日期（周一），月为 YYYY-MM"""
+    if granularity == "month":
+        return f"{bucket // 12:04d}-{bucket % 12 + 1:02d}"
+    return date.fromordinal(bucket).isoformat()
+
+
+class _Vocabulary:
+    """字符串与整数编码的双向映射"""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class _MonthlyRollup:
+    """按月物化的汇总矩阵，行为月份（从 first_month 起连续），列为编码"""
+
+    def __init__(self):
+        self.first_month = 0
+        self.totals = np.zeros((0, 0))
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def build(self, months: np.ndarray, codes: np.ndarray, amounts: np.ndarray, width: int):
+        if not len(amounts):
+            self.__init__()
+            return
+        self.first_month = int(months.min())
+        height = int(months.max()) - self.first_month + 1
+        cells = (months.astype(np.int64) - self.first_month) * width + codes
+        self.totals = np.bincount(cells, weights=amounts, minlength=height * width).reshape(height, width)
+        self.counts = np.bincount(cells, minlength=height * width).reshape(height, width)
+
+    def add(self, month: int, code: int, amount: float):
+        height, width = self.totals.shape
+        first = min(self.first_month, month) if height else month
+        last = max(self.first_month + height - 1, month) if height else month
+        if (first, last - first + 1, max(width, code + 1)) != (self.first_month, height, width):
+            # 出现新的月份或编码时扩展矩阵，每月最多发生几次
+            shape = (last - first + 1, max(width, code + 1))
+            offset = self.first_month - first
+            totals, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+            totals[offset:offset + height, :width] = self.totals
+            counts[offset:offset + height, :width] = self.counts
+            self.first_month, self.totals, self.counts = first, totals, counts
+        self.totals[month - self.first_month, code] += amount
+        self.counts[month - self.first_month, code] += 1
+
+    def window(self, first: Optional[int], last: Optional[int]) -> Tuple[int, np.ndarray, np.ndarray]:
+        """返回 [first, last] 月的行，以及第一行对应的月份"""
+        height = self.totals.shape[0]
+        lo = 0 if first is None else min(max(first - self.first_month, 0), height)
+        hi = height if last is None else min(max(last - self.first_month + 1, lo), height)
+        return self.first_month + lo, self.totals[lo:hi], self.counts[lo:hi]
+
+
+@dataclass
+class StatsResult:
+    """一次统计查询的结果，编码已换回名称"""
+    total: float
+    # 时间桶 -> 维度 -> 名称 -> 金额
+    buckets: Dict[int, Dict[str, Dict[str, float]]]
+    # 维度 -> 名称 -> 金额
+    totals: Dict[str, Dict[str, float]]
+    # (商家, 金额, 分录数)，按金额从大到小
+    merchants: List[Tuple[str, float, int]]
+    months: Dict[int, float]
+
+
+class SpendingStats(DerivedIndex):
+    """
+    收支统计索引
+
+    把账本中的 CNY 支出/收入分录转为 NumPy 列存，按日/周/月分组时用向量化运算完成；
+    同时按月物化各账户、支付账户的汇总矩阵，本进程追加交易时增量累加，
+    整月范围的按月查询直接读取矩阵，不扫描分录。
+    """
+
+    def __init__(self, currency: str = "CNY"):
+        super().__init__()
+        self.currency = currency
+        self._data_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._names = {name: _Vocabulary() for name in ("account", "payment", "merchant")}
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS}
+        # 追加的行先放在列表里，查询时再合并进数组，避免每笔交易都复制整列
+        self._pending: List[tuple] = []
+        self._monthly: Dict[int, Dict[str, _MonthlyRollup]] = {
+            kind: {dimension: _MonthlyRollup() for dimension in ROLLUP_DIMENSIONS} for kind in KINDS.values()
+        }
+
+    def rebuild(self, entries: list):
+        with self._data_lock:
+            self._reset()
+            rows = self._rows(entries)
+            if rows:
+                for (name, dtype), values in zip(_COLUMNS, zip(*rows)):
+                    self._columns[name] = np.array(values, dtype=dtype)
+            columns = self._columns
+            for kind, rollups in self._monthly.items():
+                mask = columns["kind"] == kind
+                for dimension, rollup in rollups.items():
+                    rollup.build(columns["month"][mask], columns[dimension][mask], columns["amount"][mask],
+                                 len(self._names[dimension].names))
+        print(f"Spending stats built: postings={len(rows)}")
+
+    def update(self, entries: list):
+        with self._data_lock:
+            rows = self._rows(entries)
+            self._pending.extend(rows)
+            for _, month, kind, amount, account, payment, _ in rows:
+                self._monthly[kind]["account"].add(month, account, amount)
+                self._monthly[kind]["payment"].add(month, payment, amount)
+
+    def _rows(self, entries: list) -> List[tuple]:
+        names = self._names
+        rows = []
+        for entry in entries:
+            if not isinstance(entry, data.Transaction):
+                continue
+            payment = next(
+                (p.account for p in entry.postings if p.account.split(":", 1)[0] in ("Assets", "Liabilities")),
+                ""
+            )
+            payment_code = names["payment"].code(payment)
+            merchant_code = names["merchant"].code((entry.payee or entry.narration or "").strip())
+            day, month = entry.date.toordinal(), _month_of(entry.date)
+            for posting in entry.postings:
+                units = posting.units
+                if units is None or units.number is None or units.currency != self.currency:
+                    continue
+                root = posting.account.split(":", 1)[0]
+                if root == "Expenses":
+                    kind, amount = KINDS["expense"], float(units.number)
+                elif root == "Income":
+                    kind, amount = KINDS["income"], -float(units.number)
+                else:
+                    continue
+                rows.append((day, month, kind, amount, names["account"].code(posting.account),
+                             payment_code, merchant_code))
+        return rows
+
+    def _flush(self) -> Dict[str, np.ndarray]:
+        """把追加的行合并进列数组，调用方需持有 _data_lock"""
+        if self._pending:
+            for (name, dtype), values in zip(_COLUMNS, zip(*self._pending)):
+                self._columns[name] = np.concatenate([self._columns[name], np.array(values, dtype=dtype)])
+            self._pending = []
+        return self._columns
+
+    @staticmethod
+    def _group(buckets: np.ndarray, codes: np.ndarray, amounts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """按 (时间桶, 编码) 分组求和，返回各组的时间桶、编码和金额"""
+        if not len(amounts):
+            return buckets, codes, amounts
+        width = int(codes.max()) + 1
+        keys, inverse = np.unique(buckets.astype(np.int64) * width + codes, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=amounts, minlength=len(keys))
+        return keys // width, keys % width, totals
+
+    def query(self, transaction_type: str = "expense", granularity: str = "month",
+              start: Optional[date] = None, end: Optional[date] = None, top: int = 10) -> StatsResult:
+        """
+        统计 [start, end] 内的收支
+
+        按月统计且范围为整月（或不限）时直接读取月汇总矩阵，否则在列存上向量化分组；
+        商家排行总是在列存上用 bincount 统计。
+        """
+        kind = KINDS[transaction_type]
+        whole_months = granularity == "month" \
+            and (start is None or start.day == 1) \
+            and (end is None or (end + timedelta(days=1)).day == 1)
+
+        buckets: Dict[int, Dict[str, Dict[str, float]]] = defaultdict(dict)
+        totals: Dict[str, Dict[str, float]] = {}
+        # 月汇总矩阵会被并发的增量更新修改，在锁内完成换名
+        with self._data_lock:
+            columns = self._flush()
+            mask = columns["kind"] == kind
+            if start:
+                mask &= columns["day"] >= start.toordinal()
+            if end:
+                mask &= columns["day"] <= end.toordinal()
+            amounts = columns["amount"][mask]
+
+            for dimension in ROLLUP_DIMENSIONS:
+                names = self._names[dimension].names
+                if whole_months:
+                    base, matrix, counts = self._monthly[kind][dimension].window(
+                        _month_of(start) if start else None, _month_of(end) if end else None
+                    )
+                    rows, codes = np.nonzero(counts)
+                    groups = (rows + base, codes, matrix[rows, codes])
+                    code_totals, code_counts = matrix.sum(axis=0), counts.sum(axis=0)
+                    if dimension == "account":
+                        present = counts.any(axis=1)
+                        months = dict(zip((np.flatnonzero(present) + base).tolist(),
+                                          matrix.sum(axis=1)[present].tolist()))
+                else:
+                    codes = columns[dimension][mask]
+                    if granularity == "month":
+                        periods = columns["month"][mask]
+                    elif granularity == "week":
+                        # 序数 1 (0001-01-01) 是周一，按周一对齐
+                        days = columns["day"][mask]
+                        periods = days - (days - 1) % 7
+                    else:
+                        periods = columns["day"][mask]
+                    groups = self._group(periods, codes, amounts)
+                    code_totals = np.bincount(codes, weights=amounts, minlength=len(names))
+                    code_counts = np.bincount(codes, minlength=len(names))
+                    if dimension == "account":
+                        month_keys, inverse = np.unique(columns["month"][mask], return_inverse=True)
+                        months = dict(zip(month_keys.tolist(),
+                                          np.bincount(inverse.ravel(), weights=amounts).tolist()))
+
+                for bucket, code, total in zip(*(group.tolist() for group in groups)):
+                    buckets[bucket].setdefault(dimension, {})[names[code]] = total
+                present = np.flatnonzero(code_counts)
+                totals[dimension] = dict(zip((names[code] for code in present.tolist()),
+                                             code_totals[present].tolist()))
+
+            merchants = self._names["merchant"].names
+            codes = columns["merchant"][mask]
+            merchant_totals = np.bincount(codes, weights=amounts, minlength=len(merchants))
+            merchant_counts = np.bincount(codes, minlength=len(merchants))
+            present = np.flatnonzero(merchant_counts)
+            ranked = present[np.argsort(-merchant_totals[present], kind="stable")][:top]
+            top_merchants = [
+                (merchants[code], total, count) for code, total, count in
+                zip(ranked.tolist(), merchant_totals[ranked].tolist(), merchant_counts[ranked].tolist())
+            ]
+
+        return StatsResult(
+            total=sum(totals["account"].values()),
+            buckets=dict(sorted(buckets.items())),
+            totals=totals,
+            merchants=top_merchants,
+            months=dict(sorted(months.items())),
+        )
+
+
+_stats: Optional[SpendingStats] = None
+
+
+def get_spending_stats() -> SpendingStats:
+    global _stats
+    if _stats is None:
+        _stats = SpendingStats()
+    return _stats
@@ -0,0 +1,186 @@
+"""记账文本的本地规则解析，简单输入无需调用 VLM"""
+import re
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from ..utils.datetime_utils import get_beijing_time
+
+if TYPE_CHECKING:
+    from .account_index import AccountIndex
+
+# 与 prompts.get_text_parse_prompt 中的规则保持一致
+PAYMENT_ALIASES = {
+    "支付宝": "支付宝", "宝": "支付宝", "alipay": "支付宝",
+    "微信": "微信", "wx": "微信", "微信支付": "微信",
+    "现金": "现金",
+    "银行卡": "银行卡", "刷卡": "银行卡",
+}
+
+BANK_ALIASES = {
+    "建设银行": "CCB", "建行": "CCB", "建": "CCB", "ccb": "CCB",
+    "中国银行": "BOC", "中行": "BOC", "中": "BOC", "boc": "BOC",
+    "工商银行": "ICBC", "工行": "ICBC", "工": "ICBC", "icbc": "ICBC",
+}
+
+CATEGORY_KEYWORDS = {
+    "早餐": ["早饭", "早点", "包子", "豆浆"],
+    "午餐": ["午饭", "外卖"],
+    "晚餐": ["晚饭", "夜宵"],
+    "零食": ["饮料", "奶茶", "水果", "咖啡", "星巴克", "瑞幸"],
+    "买菜": ["菜市场", "盒马"],
+    "公交": ["地铁", "公共交通"],
+    "打车": ["滴滴", "出租车", "taxi"],
+    "加油": ["充电", "中石化", "中石油"],
+    "房租": ["租金"],
+    "水电": ["水费", "电费", "燃气", "水电费"],
+    "宽带": ["话费", "流量", "网费"],
+    "衣服": ["鞋", "裤子", "外套"],
+    "数码": ["手机", "电脑", "耳机"],
+    "日用品": ["洗发水", "牙膏", "日化", "生活用品"],
+    "电影": ["电影票", "影院"],
+    "游戏": ["充值", "steam"],
+    "聚餐": ["请客", "饭局"],
+    "药品": ["药店", "买药"],
+    "看病": ["挂号", "医院"],
+    "红包": ["礼金", "随礼"],
+}
+
+DATE_WORDS = {"今天": 0, "昨天": 1, "前天": 2}
+
+_AMOUNT_RE = re.compile(r"^[¥￥]?(\d+(?:\.\d{1,2})?)(?:元|块)?$")
+_BANK_RE = re.compile(
+    r"^(" + "|".join(sorted(map(re.escape, BANK_ALIASES), key=len, reverse=True)) + r")(\d{4})?$",
+    re.IGNORECASE,
+)
+_CARD_RE = re.compile(r"^\d{4}$")
+
+
+def _load_categories(index: "AccountIndex") -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    从账户索引读取分类白名单，返回 (关键词 -> 分类, 分类 -> 交易类型)
+
+    关键词表随账户索引的版本重建，账本中新增的分类和别名无需重启即可生效。
+    """
+    global _categories
+    if _categories is not None and _categories[0] == index.version:
+        return _categories[1], _categories[2]
+
+    types = index.category_types
+    keywords = {category: category for category in types}
+    for alias, category in index.category_aliases.items():
+        keywords.setdefault(alias, category)
+    for category, words in CATEGORY_KEYWORDS.items():
+        if category in types:
+            for word in words:
+                keywords.setdefault(word, category)
+    _categories = (index.version, keywords, types)
+    return keywords, types
+
+
+# (账户索引版本, 关键词 -> 分类, 分类 -> 交易类型)
+_categories: Optional[Tuple[int, Dict[str, str], Dict[str, str]]] = None
+
+
+def _match_category(words: List[str], keywords: Dict[str, str]) -> Tuple[Optional[str], float]:
+    """返回 (分类, 置信度)，精确命中白名单置信度最高，多个候选时降低"""
+    exact = {keywords[word] for word in words if word in keywords}
+    if len(exact) == 1:
+        return exact.pop(), 1.0
+    if len(exact) > 1:
+        return None, 0.0
+
+    text = "".join(words).lower()
+    fuzzy = {category for keyword, category in keywords.items() if keyword.lower() in text}
+    if len(fuzzy) == 1:
+        return fuzzy.pop(), 0.95
+    return None, 0.0
+
+
+def parse_text_locally(
+    text: str,
+    merchant_lookup: Optional[Callable[[str], Optional[Tuple[Dict[str, str], float]]]] = None,
+    account_index: Optional["AccountIndex"] = None
+) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    按规则解析形如"午餐 25 微信"、"打车 38.5 CCB 0388"的记账文本
+
+    Args:
+        text: 用户输入
+        merchant_lookup: 可选，按商家名查询历史账本，返回 (分类/支付方式字段, 置信度)
+        account_index: 账户映射索引，异步调用方应先 await aaccount_index() 后传入；
+            不传时同步读取，会在当前线程检查账本
+
+    Returns:
+        (与 ParseResponse 字段一致的结果, 置信度)，无法解析时结果为 None
+    """
+    tokens = text.split()
+    if not tokens or len(tokens) > 6:
+        return None, 0.0
+
+    amounts = []
+    words = []
+    payment_method = ""
+    bank_name = ""
+    card_last_four = ""
+    days_ago = 0
+
+    for i, token in enumerate(tokens):
+        lowered = token.lower()
+        bank = _BANK_RE.match(token)
+        if lowered in PAYMENT_ALIASES:
+            payment_method = PAYMENT_ALIASES[lowered]
+        elif bank and (bank.group(2) or len(bank.group(1)) > 1):
+            payment_method = "银行卡"
+            bank_name = BANK_ALIASES[bank.group(1).lower()]
+            card_last_four = bank.group(2) or ""
+        elif _CARD_RE.match(token) and bank_name and not card_last_four and i > 0 and tokens[i - 1].lower() in BANK_ALIASES:
+            card_last_four = token
+        elif _AMOUNT_RE.match(token):
+            amounts.append(float(_AMOUNT_RE.match(token).group(1)))
+        elif token in DATE_WORDS:
+            days_ago = DATE_WORDS[token]
+        else:
+            words.append(token)
+
+    if len(amounts) != 1 or not words:
+        return None, 0.0
+
+    if account_index is None:
+        from .beancount_ops import get_beancount_service
+        account_index = get_beancount_service().account_index()
+    keywords, types = _load_categories(account_index)
+
+    merchant = "".join(words)
+    category, confidence = _match_category(words, keywords)
+    if category is not None:
+        transaction_type = types[category]
+    else:
+        # 分类词未命中时，用历史账本中该商家最常用的分类
+        hint = merchant_lookup(merchant) if merchant_lookup else None
+        if hint is None or "category" not in hint[0]:
+            return None, 0.0
+        fields, confidence = hint
+        category = fields["category"]
+        transaction_type = fields["transaction_type"]
+        if not payment_method and fields.get("payment_method"):
+            payment_method = fields["payment_method"]
+            bank_name = fields.get("bank_name", "")
+            card_last_four = fields.get("card_last_four", "")
+
+    if not payment_method:
+        # 支付方式需要常识推断（如工资通常是银行卡），交给模型
+        confidence -= 0.3
+    elif payment_method == "银行卡" and not card_last_four:
+        confidence -= 0.1
+
+    date = (get_beijing_time() - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+    return {
+        "date": date,
+        "amount": amounts[0],
+        "merchant": merchant,
+        "payment_method": payment_method,
+        "bank_name": bank_name,
+        "card_last_four": card_last_four,
+        "transaction_type": transaction_type,
+        "category": category,
+        "description": merchant,
+    }, confidence
@@ -1,6 +1,10 @@
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from collections import deque
+from typing import AsyncIterator, Dict, Any
 from pydantic import BaseModel
+from .prompts import Prompt
 
 class TransactionData(BaseModel):
     date: str
@@ -13,11 +17,65 @@ class TransactionData(BaseModel):
     category: str = ""
     description: str = ""
 
+class VLMUsageStats:
+    """记录每次 VLM 调用的 prompt token 数及其中命中提供商缓存的部分"""
+
+    _lock = threading.Lock()
+    _recent = deque(maxlen=100)
+    _totals = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    @classmethod
+    def record(cls, model: str, kind: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int):
+        with cls._lock:
+            cls._recent.append({
+                "time": time.time(),
+                "model": model,
+                "kind": kind,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "completion_tokens": completion_tokens,
+            })
+            cls._totals["calls"] += 1
+            cls._totals["prompt_tokens"] += prompt_tokens
+            cls._totals["cached_tokens"] += cached_tokens
+            cls._totals["completion_tokens"] += completion_tokens
+        print(f"VLM usage: {kind} prompt={prompt_tokens} cached={cached_tokens} completion={completion_tokens}")
+
+    @classmethod
+    def summary(cls) -> Dict[str, Any]:
+        with cls._lock:
+            totals = dict(cls._totals)
+            recent = list(cls._recent)
+        totals["cache_hit_ratio"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+        return {"totals": totals, "recent": recent}
+
+
 class VLMService(ABC):
+    model: str = ""
+
+    @property
+    def model_id(self) -> str:
+        """提供商及模型名，用于区分不同模型的解析结果"""
+        return f"{type(self).__name__}:{self.model}"
+
+    async def close(self):
+        """释放底层客户端及连接池"""
+        pass
+
+    @abstractmethod
+    async def parse_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def parse_text(self, text: str, prompt: Prompt) -> Dict[str, Any]:
+        pass
+
     @abstractmethod
-    async def parse_image(self, image_data: bytes, prompt: str) -> Dict[str, Any]:
+    def stream_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> AsyncIterator[str]:
+        """以流式方式解析图片，逐段返回模型输出的文本"""
         pass
 
     @abstractmethod
-    async def parse_text(self, text: str, prompt: str) -> Dict[str, Any]:
+    def stream_text(self, text: str, prompt: Prompt) -> AsyncIterator[str]:
+        """以流式方式解析文本，逐段返回模型输出的文本"""
         pass
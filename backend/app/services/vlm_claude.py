@@ -1,50 +1,106 @@
 import base64
 import json
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Optional
+import httpx
 from anthropic import AsyncAnthropic
-from .vlm_base import VLMService
+from .prompts import Prompt
+from .vlm_base import VLMService, VLMUsageStats
 from ..config import settings
 
+# 较早版本的 API 需要通过 beta 头启用 prompt caching
+PROMPT_CACHE_HEADERS = {"anthropic-beta": "prompt-caching-2024-07-31"}
+
 class ClaudeVLMService(VLMService):
-    def __init__(self):
-        self.client = AsyncAnthropic(api_key=settings.VLM_API_KEY)
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        self.client = AsyncAnthropic(
+            api_key=settings.VLM_API_KEY,
+            timeout=settings.VLM_TIMEOUT,
+            http_client=http_client
+        )
         self.model = settings.CLAUDE_MODEL
 
-    async def parse_image(self, image_data: bytes, prompt: str) -> Dict[str, Any]:
+    async def close(self):
+        await self.client.close()
+
+    @staticmethod
+    def _system(prompt: Prompt) -> List[Dict[str, Any]]:
+        # 固定前缀作为 system 并打上缓存标记，后续请求直接命中提供商的 prompt cache
+        return [{"type": "text", "text": prompt.prefix, "cache_control": {"type": "ephemeral"}}]
+
+    @staticmethod
+    def _image_messages(image_data: bytes, prompt: Prompt, media_type: str) -> List[Dict[str, Any]]:
         base64_image = base64.b64encode(image_data).decode('utf-8')
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": media_type,
+                            "data": base64_image
+                        }
+                    },
+                    {"type": "text", "text": prompt.suffix}
+                ]
+            }
+        ]
+
+    @staticmethod
+    def _text_messages(text: str, prompt: Prompt) -> List[Dict[str, Any]]:
+        return [
+            {"role": "user", "content": f"{prompt.suffix}\n\n用户输入: {text}"}
+        ]
 
+    def _record_usage(self, kind: str, usage):
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        prompt_tokens = usage.input_tokens + cache_read + cache_creation
+        VLMUsageStats.record(self.model, kind, prompt_tokens, cache_read, usage.output_tokens)
+
+    async def parse_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> Dict[str, Any]:
         message = await self.client.messages.create(
             model=self.model,
             max_tokens=500,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        },
-                        {"type": "text", "text": prompt}
-                    ]
-                }
-            ]
+            system=self._system(prompt),
+            messages=self._image_messages(image_data, prompt, media_type),
+            extra_headers=PROMPT_CACHE_HEADERS
         )
+        self._record_usage("image", message.usage)
 
         content = message.content[0].text
         return json.loads(content)
 
-    async def parse_text(self, text: str, prompt: str) -> Dict[str, Any]:
+    async def parse_text(self, text: str, prompt: Prompt) -> Dict[str, Any]:
         message = await self.client.messages.create(
             model=self.model,
             max_tokens=300,
-            messages=[
-                {"role": "user", "content": f"{prompt}\n\n用户输入: {text}"}
-            ]
+            system=self._system(prompt),
+            messages=self._text_messages(text, prompt),
+            extra_headers=PROMPT_CACHE_HEADERS
         )
+        self._record_usage("text", message.usage)
 
         content = message.content[0].text
         return json.loads(content)
+
+    async def stream_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> AsyncIterator[str]:
+        async for delta in self._stream("image", prompt, self._image_messages(image_data, prompt, media_type), 500):
+            yield delta
+
+    async def stream_text(self, text: str, prompt: Prompt) -> AsyncIterator[str]:
+        async for delta in self._stream("text", prompt, self._text_messages(text, prompt), 300):
+            yield delta
+
+    async def _stream(self, kind: str, prompt: Prompt, messages: List[Dict[str, Any]], max_tokens: int) -> AsyncIterator[str]:
+        async with self.client.messages.stream(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=self._system(prompt),
+            messages=messages,
+            extra_headers=PROMPT_CACHE_HEADERS
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            self._record_usage(kind, (await stream.get_final_message()).usage)
@@ -1,12 +1,63 @@
+from typing import Optional
+import httpx
 from .vlm_base import VLMService
 from .vlm_openai import OpenAIVLMService
 from .vlm_claude import ClaudeVLMService
 from ..config import settings
 
+
+class VLMProviderRegistry:
+    """
+    VLM 客户端注册表
+
+    客户端在应用启动时创建一次，所有解析请求共享同一个保持长连接的 HTTP 连接池，
+    应用关闭时统一释放，避免每次请求重复建立连接和 TLS 握手。
+    """
+
+    _service: Optional[VLMService] = None
+    _http_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def startup(cls):
+        """创建共享连接池和 VLM 客户端"""
+        if cls._service is not None:
+            return
+        cls._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.VLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.VLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.VLM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=settings.VLM_TIMEOUT,
+        )
+        cls._service = cls._create(cls._http_client)
+        print(f"VLM client ready: provider={settings.VLM_PROVIDER}")
+
+    @classmethod
+    async def shutdown(cls):
+        """关闭 VLM 客户端及连接池"""
+        if cls._service is not None:
+            await cls._service.close()
+            cls._service = None
+        if cls._http_client is not None:
+            await cls._http_client.aclose()
+            cls._http_client = None
+
+    @classmethod
+    def get(cls) -> VLMService:
+        if cls._service is None:
+            cls.startup()
+        return cls._service
+
+    @staticmethod
+    def _create(http_client: httpx.AsyncClient) -> VLMService:
+        if settings.VLM_PROVIDER == "openai":
+            return OpenAIVLMService(http_client)
+        elif settings.VLM_PROVIDER == "claude":
+            return ClaudeVLMService(http_client)
+        else:
+            raise ValueError(f"Unsupported VLM provider: {settings.VLM_PROVIDER}")
+
+
 def get_vlm_service() -> VLMService:
-    if settings.VLM_PROVIDER == "openai":
-        return OpenAIVLMService()
-    elif settings.VLM_PROVIDER == "claude":
-        return ClaudeVLMService()
-    else:
-        raise ValueError(f"Unsupported VLM provider: {settings.VLM_PROVIDER}")
+    return VLMProviderRegistry.get()
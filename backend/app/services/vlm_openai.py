@@ -1,41 +1,64 @@
 import base64
 import json
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Optional
+import httpx
 from openai import AsyncOpenAI
-from .vlm_base import VLMService
+from .prompts import Prompt
+from .vlm_base import VLMService, VLMUsageStats
 from ..config import settings
 
 class OpenAIVLMService(VLMService):
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.client = AsyncOpenAI(
             api_key=settings.VLM_API_KEY,
-            base_url=settings.OPENAI_BASE_URL
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.VLM_TIMEOUT,
+            http_client=http_client
         )
         self.model = settings.OPENAI_MODEL
 
-    async def parse_image(self, image_data: bytes, prompt: str) -> Dict[str, Any]:
-        base64_image = base64.b64encode(image_data).decode('utf-8')
+    async def close(self):
+        await self.client.close()
 
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
+    # 固定前缀放在最前面的 system 消息中，OpenAI 会自动缓存相同的前缀
+    @staticmethod
+    def _image_messages(image_data: bytes, prompt: Prompt, media_type: str) -> List[Dict[str, Any]]:
+        base64_image = base64.b64encode(image_data).decode('utf-8')
+        return [
+            {"role": "system", "content": prompt.prefix},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt.suffix},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{media_type};base64,{base64_image}"
                         }
-                    ]
-                }
-            ],
-            max_tokens=5000
-        )
+                    }
+                ]
+            }
+        ]
 
-        content = response.choices[0].message.content
+    @staticmethod
+    def _text_messages(text: str, prompt: Prompt) -> List[Dict[str, Any]]:
+        return [
+            {"role": "system", "content": prompt.prefix},
+            {"role": "user", "content": f"{prompt.suffix}\n\n用户输入: {text}"}
+        ]
+
+    def _record_usage(self, kind: str, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            cached_tokens = details.get("cached_tokens") or 0
+        else:
+            cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        VLMUsageStats.record(self.model, kind, usage.prompt_tokens, cached_tokens, usage.completion_tokens)
+
+    @staticmethod
+    def _load_json(content: str) -> Dict[str, Any]:
         # 清理markdown代码块标记
         content = content.strip()
         if content.startswith('```json'):
@@ -47,25 +70,48 @@ class OpenAIVLMService(VLMService):
         content = content.strip()
         return json.loads(content)
 
-    async def parse_text(self, text: str, prompt: str) -> Dict[str, Any]:
+    async def parse_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> Dict[str, Any]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=self._image_messages(image_data, prompt, media_type),
+            max_tokens=5000
+        )
+        self._record_usage("image", response.usage)
+
+        content = response.choices[0].message.content
+        return self._load_json(content)
+
+    async def parse_text(self, text: str, prompt: Prompt) -> Dict[str, Any]:
         print({"text": text, "prompt": prompt})
         response = await self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "user", "content": f"{prompt}\n\n用户输入: {text}"}
-            ],
+            messages=self._text_messages(text, prompt),
             max_tokens=3000
         )
+        self._record_usage("text", response.usage)
 
         content = response.choices[0].message.content
         print(content)
-        # 清理markdown代码块标记
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.startswith('```'):
-            content = content[3:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        return json.loads(content)
+        return self._load_json(content)
+
+    async def stream_image(self, image_data: bytes, prompt: Prompt, media_type: str = "image/jpeg") -> AsyncIterator[str]:
+        async for delta in self._stream("image", self._image_messages(image_data, prompt, media_type), 5000):
+            yield delta
+
+    async def stream_text(self, text: str, prompt: Prompt) -> AsyncIterator[str]:
+        async for delta in self._stream("text", self._text_messages(text, prompt), 3000):
+            yield delta
+
+    async def _stream(self, kind: str, messages: List[Dict[str, Any]], max_tokens: int) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            # 最后一个 chunk 携带 token 用量
+            extra_body={"stream_options": {"include_usage": True}}
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            self._record_usage(kind, getattr(chunk, "usage", None))
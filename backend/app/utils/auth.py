@@ -1,5 +1,8 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
@@ -24,15 +27,81 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+class TokenCache:
+    """
+    已验证 token 的 LRU 缓存
+
+    token -> (用户名, 过期时间)，过期时间取 token 的 exp 与 AUTH_TOKEN_CACHE_TTL 中较早者。
+    只缓存验证通过的 token，无效 token 每次都完整校验。
+    """
+
+    _entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def get(cls, token: str, now: float) -> Optional[str]:
+        with cls._lock:
+            item = cls._entries.get(token)
+            if item is not None:
+                username, expires_at = item
+                if now < expires_at:
+                    cls._entries.move_to_end(token)
+                    cls.hits += 1
+                    return username
+                del cls._entries[token]
+            cls.misses += 1
+            return None
+
+    @classmethod
+    def put(cls, token: str, username: str, expires_at: float):
+        with cls._lock:
+            cls._entries[token] = (username, expires_at)
+            cls._entries.move_to_end(token)
+            while len(cls._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            total = cls.hits + cls.misses
+            return {
+                "size": len(cls._entries),
+                "hits": cls.hits,
+                "misses": cls.misses,
+                "hit_ratio": round(cls.hits / total, 4) if total else 0.0,
+            }
+
+
+def decode_token(token: Optional[str]) -> Optional[str]:
+    """验证 token 并返回用户名，无效时返回 None"""
+    if not token:
+        return None
+    now = time.time()
+    username = TokenCache.get(token, now)
+    if username is not None:
         return username
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    expires_at = now + settings.AUTH_TOKEN_CACHE_TTL
+    if payload.get("exp") is not None:
+        expires_at = min(expires_at, float(payload["exp"]))
+    TokenCache.put(token, username, expires_at)
+    return username
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    username = decode_token(credentials.credentials)
+    if username is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return username
 
 def authenticate_user(username: str, password: str) -> bool:
     if username == settings.ADMIN_USERNAME and password == settings.ADMIN_PASSWORD:
@@ -0,0 +1,53 @@
+"""跨进程文件锁"""
+import os
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextmanager
+def locked_file(f, shared: bool = False):
+    """
+    对已打开的文件加锁（advisory lock），退出时释放
+
+    Args:
+        f: 已打开的文件对象
+        shared: 是否为共享锁（读锁），Windows 下总是排他锁
+    """
+    if os.name == 'nt':
+        # Windows 下锁定文件第一个字节，阻塞直到获得锁
+        position = f.tell()
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        f.seek(position)
+        try:
+            yield f
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(f) -> bool:
+    """
+    尝试对已打开的文件加排他锁，不阻塞
+
+    锁随文件关闭（包括进程退出）自动释放，可用于多进程之间的选主。
+    """
+    try:
+        if os.name == 'nt':
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
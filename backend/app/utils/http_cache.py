@@ -0,0 +1,110 @@
+"""ETag 条件请求与响应压缩"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from ..config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 同一 ETag 的响应内容不变，序列化和压缩结果直接复用：
+# (ETag, 客户端接受的编码) -> (响应体, 实际使用的编码)
+_bodies: "OrderedDict[Tuple[str, str], Tuple[bytes, str]]" = OrderedDict()
+_bodies_lock = threading.Lock()
+_MAX_BODIES = 64
+
+
+def make_etag(*parts: Any) -> str:
+    """由若干部分生成弱 ETag，不同压缩编码的响应共用同一个 ETag"""
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match 是否与 etag 匹配（弱比较）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _choose_encoding(request: Request) -> str:
+    accepted = {
+        item.split(";", 1)[0].strip().lower()
+        for item in request.headers.get("accept-encoding", "").split(",")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def _encode(content: Any, encoding: str) -> Tuple[bytes, str]:
+    body = json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    # 小响应压缩收益不大，直接返回原文
+    if len(body) < settings.HTTP_COMPRESS_MIN_BYTES or encoding == "identity":
+        return body, "identity"
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
+
+
+def conditional_json_response(
+    request: Request,
+    etag: str,
+    build: Callable[[], Any],
+    cache_control: str = "private, no-cache",
+) -> Response:
+    """
+    带 ETag 的 JSON 响应
+
+    If-None-Match 命中时直接返回 304，不调用 build；
+    否则序列化 build() 的结果，按 Accept-Encoding 压缩并按 ETag 缓存。
+
+    Args:
+        request: 当前请求
+        etag: make_etag 生成的 ETag
+        build: 生成响应内容的函数
+        cache_control: Cache-Control 头，默认要求客户端每次重新验证
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = _choose_encoding(request)
+    key = (etag, encoding)
+    with _bodies_lock:
+        cached: Optional[Tuple[bytes, str]] = _bodies.get(key)
+        if cached is not None:
+            _bodies.move_to_end(key)
+    if cached is None:
+        cached = _encode(build(), encoding)
+        with _bodies_lock:
+            _bodies[key] = cached
+            while len(_bodies) > _MAX_BODIES:
+                _bodies.popitem(last=False)
+
+    body, applied = cached
+    if applied != "identity":
+        headers["Content-Encoding"] = applied
+    return Response(content=body, media_type="application/json", headers=headers)
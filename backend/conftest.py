@@ -0,0 +1,5 @@
+"""pytest 公共配置"""
+import os
+
+# app.config 要求必须配置 VLM_API_KEY，单元测试不会调用 VLM，给一个占位值即可
+os.environ.setdefault("VLM_API_KEY", "test")
@@ -0,0 +1,110 @@
+"""测试按日期查询的多币种余额索引"""
+import sys
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from beancount import loader
+from beancount.core import data, realization
+from app.services.balance_index import BalanceIndex
+
+LEDGER = """
+2026-01-01 open Assets:Alipay
+2026-01-01 open Assets:Broker
+2026-01-01 open Expenses:Food
+2026-01-01 open Equity:Opening
+
+2026-01-02 * "opening"
+  Assets:Alipay  1000.00 CNY
+  Equity:Opening
+
+2026-01-05 * "lunch"
+  Expenses:Food  25.00 CNY
+  Assets:Alipay
+
+2026-01-05 * "dinner"
+  Expenses:Food  40.00 CNY
+  Assets:Alipay
+
+2026-01-06 price USD 7.10 CNY
+
+2026-01-10 * "buy usd"
+  Assets:Broker  100.00 USD @ 7.20 CNY
+  Assets:Alipay
+
+2026-01-12 * "buy jpy"
+  Assets:Broker  1000 JPY
+  Equity:Opening
+
+2026-01-20 price USD 7.30 CNY
+
+2026-01-25 * "lunch"
+  Expenses:Food  30.00 CNY
+  Assets:Alipay
+"""
+
+
+def _load():
+    entries, errors, _ = loader.load_string(LEDGER)
+    assert not errors
+    return entries
+
+
+def _realized(entries, as_of):
+    """用 beancount 的 realize 计算截至 as_of 的余额作为对照"""
+    limited = [entry for entry in entries if as_of is None or entry.date <= as_of]
+    root = realization.realize(limited)
+    holdings = {}
+    for account in realization.iter_children(root):
+        positions = {pos.units.currency: pos.units.number for pos in account.balance if pos.units.number}
+        if positions:
+            holdings[account.account] = positions
+    return holdings
+
+
+def test_matches_realization_for_every_date():
+    entries = _load()
+    index = BalanceIndex()
+    index.rebuild(entries)
+    day = date(2025, 12, 31)
+    while day <= date(2026, 2, 1):
+        holdings, _, _ = index.query(as_of=day)
+        assert holdings == _realized(entries, day), day
+        day += timedelta(days=1)
+    assert index.query()[0] == _realized(entries, None)
+
+
+def test_update_matches_rebuild():
+    """增量追加（包括早于已有交易的日期）与全量重建结果一致"""
+    entries = _load()
+    transactions = [entry for entry in entries if isinstance(entry, data.Transaction)]
+    others = [entry for entry in entries if not isinstance(entry, data.Transaction)]
+    incremental = BalanceIndex()
+    incremental.rebuild(others + transactions[:2])
+    # 倒序追加，覆盖插入到中间位置和同一天的情况
+    for entry in reversed(transactions[2:]):
+        incremental.update([entry])
+    full = BalanceIndex()
+    full.rebuild(entries)
+    for day in (date(2026, 1, 4), date(2026, 1, 5), date(2026, 1, 11), date(2026, 1, 25), None):
+        assert incremental.query(as_of=day)[0] == full.query(as_of=day)[0], day
+
+
+def test_currency_conversion_uses_price_as_of_date():
+    index = BalanceIndex()
+    index.rebuild(_load())
+
+    _, balances, missing = index.query(as_of=date(2026, 1, 15), convert=True)
+    assert balances["Assets:Broker"] == Decimal("100.00") * Decimal("7.10")
+    # JPY 没有价格，记入 missing 而不是按 0 计算
+    assert missing == {"Assets:Broker": {"JPY": Decimal("1000")}, "Equity:Opening": {"JPY": Decimal("-1000")}}
+
+    _, balances, _ = index.query(convert=True)
+    assert balances["Assets:Broker"] == Decimal("100.00") * Decimal("7.30")
+
+    _, balances, missing = index.query()
+    assert "Assets:Broker" not in balances and not missing
+    assert balances["Assets:Alipay"] == Decimal("1000.00") - 25 - 40 - 720 - 30
@@ -0,0 +1,80 @@
+"""测试交易文本生成与校验"""
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from beancount import loader
+from app.config import settings
+from app.services.beancount_ops import BeancountService
+
+ACCOUNTS = ("Expenses:Food", "Assets:Alipay")
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BEANCOUNT_MAIN_PATH", str(tmp_path / "main.beancount"))
+    monkeypatch.setattr(settings, "BEANCOUNT_TRANSACTION_PATH", str(tmp_path / "transactions.beancount"))
+    return BeancountService()
+
+
+def _format(service, **kwargs):
+    item = dict(date="2026-01-05", amount=12.5, merchant="星巴克", description="")
+    item.update(kwargs)
+    return service._format_transaction(
+        item["date"], item["amount"], item["merchant"], item["description"], *ACCOUNTS[::-1]
+    )
+
+
+def test_text_matches_entry(service, tmp_path):
+    """写入的文本解析后与缓存用的交易对象一致"""
+    pending = _format(service, date="2026-1-5", amount=0.125, merchant="Café", description="拿铁 大杯")
+    path = tmp_path / "check.beancount"
+    path.write_text(
+        "".join(f"2026-01-01 open {account}\n" for account in ACCOUNTS) + pending.text, encoding="utf-8"
+    )
+    entries, errors, _ = loader.load_file(str(path))
+    assert not errors
+    parsed = entries[-1]
+    assert parsed.date == pending.entry.date
+    assert (parsed.payee, parsed.narration) == (pending.entry.payee, pending.entry.narration)
+    assert [(p.account, p.units) for p in parsed.postings] == \
+        [(p.account, p.units) for p in pending.entry.postings]
+
+
+@pytest.mark.parametrize("amount", [-5, 0, 0.001, float("nan"), float("inf"), float("-inf")])
+def test_rejects_invalid_amount(service, amount):
+    with pytest.raises(ValueError):
+        _format(service, amount=amount)
+
+
+@pytest.mark.parametrize("field", ["merchant", "description"])
+@pytest.mark.parametrize("value", ['say "hi"', "a\\b", "line\nbreak", "cr\rlf"])
+def test_rejects_unsafe_strings(service, field, value):
+    with pytest.raises(ValueError):
+        _format(service, **{field: value})
+
+
+def test_bulk_reports_invalid_items(service):
+    """无效条目变为对应位置的异常，不影响其他条目"""
+    class Index:
+        def asset_account(self, *args):
+            return ACCOUNTS[1]
+
+        def expense_account(self, category):
+            return ACCOUNTS[0]
+
+    base = dict(date="2026-01-05", amount=10, merchant="m", payment_method="支付宝", category="午餐")
+    built = service.build_transactions(
+        [base, {**base, "amount": -1}, {**base, "merchant": 'x"y'}, {**base, "date": "2026-13-01"}], Index()
+    )
+    assert not isinstance(built[0], Exception)
+    assert all(isinstance(item, ValueError) for item in built[1:])
+
+
+def test_append_transaction_signature(service):
+    """append_transaction 保持显式参数，拼错的参数名直接报错"""
+    with pytest.raises(TypeError):
+        service.append_transaction(date="2026-01-05", amount=1, merchant="m", payment_method="现金", categroy="午餐")
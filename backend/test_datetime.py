@@ -31,11 +31,11 @@ def test_prompts():
         print("=" * 60)
         
         print("\n图片解析Prompt片段:")
-        image_prompt = get_image_parse_prompt()
+        image_prompt = get_image_parse_prompt().text
         print(image_prompt[:500] + "...")
         
         print("\n文本解析Prompt片段:")
-        text_prompt = get_text_parse_prompt()
+        text_prompt = get_text_parse_prompt().text
         print(text_prompt[:500] + "...")
         
         # 验证日期是否在prompt中
@@ -0,0 +1,77 @@
+"""测试上传前的图片预处理"""
+import sys
+import os
+import io
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from PIL import Image, ImageDraw, PngImagePlugin
+from app.services.image_preprocess import ImagePreprocessor
+
+
+def _screenshot(size=(300, 200), margin=0) -> Image.Image:
+    """白底截图，margin 为 0 时内容贴近四边，不会被裁剪"""
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    right, bottom = size[0] - margin - 1, size[1] - margin - 1
+    draw.rectangle((margin + 3, margin + 3, right, bottom), outline=(40, 120, 200), width=2)
+    draw.text((margin + 10, margin + 10), "Payment 23.50", fill="black")
+    return img
+
+
+def _png(img: Image.Image) -> bytes:
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Comment", "secret location")
+    output = io.BytesIO()
+    img.save(output, "PNG", pnginfo=info, icc_profile=b"\0" * 64)
+    return output.getvalue()
+
+
+def _jpeg(img: Image.Image, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "Camera"
+    output = io.BytesIO()
+    img.save(output, "JPEG", quality=95, exif=exif.tobytes())
+    return output.getvalue()
+
+
+def test_small_png_keeps_pixels_without_metadata():
+    img = _screenshot()
+    prepared = ImagePreprocessor.process(_png(img))
+    assert prepared.media_type == "image/png"
+    result = Image.open(io.BytesIO(prepared.data))
+    assert "Comment" not in result.info and "icc_profile" not in result.info
+    assert list(result.convert("RGB").getdata()) == list(img.getdata())
+
+
+def test_small_png_is_cropped_first():
+    prepared = ImagePreprocessor.process(_png(_screenshot(margin=40)))
+    assert prepared.processed_size[0] < 300 and prepared.processed_size[1] < 200
+    assert "Comment" not in Image.open(io.BytesIO(prepared.data)).info
+
+
+def test_jpeg_metadata_stripped_without_reencoding():
+    img = _screenshot()
+    original = _jpeg(img)
+    prepared = ImagePreprocessor.process(original)
+    assert prepared.media_type == "image/jpeg"
+    assert len(prepared.data) < len(original)
+    result = Image.open(io.BytesIO(prepared.data))
+    assert not result.getexif()
+    # 扫描数据原样保留，解码结果与原图相同
+    assert list(result.getdata()) == list(Image.open(io.BytesIO(original)).getdata())
+
+
+def test_rotated_jpeg_is_reencoded_upright():
+    prepared = ImagePreprocessor.process(_jpeg(_screenshot(), orientation=6))
+    assert prepared.processed_size == (200, 300)
+    assert not Image.open(io.BytesIO(prepared.data)).getexif()
+
+
+def test_large_image_is_resized():
+    img = Image.frombytes("RGB", (3000, 1000), os.urandom(3000 * 1000 * 3))
+    prepared = ImagePreprocessor.process(_png(img))
+    assert max(prepared.processed_size) <= 1568
+    assert prepared.media_type == "image/jpeg"
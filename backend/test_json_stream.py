@@ -0,0 +1,55 @@
+"""测试流式 JSON 增量解析"""
+import json
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.services.json_stream import IncrementalJSONObjectParser
+
+# 模型的典型输出：带 markdown 代码块、中文、小数、指数和转义字符
+MODEL_OUTPUT = (
+    '```json\n{\n  "date": "2026-01-15",\n  "amount": 38.5,\n  "merchant": "星巴克 \\"南京路\\"",\n'
+    '  "payment_method": "支付宝",\n  "fee": 1e-2,\n  "count": 12 ,\n  "refund": false,\n'
+    '  "tags": ["咖啡", "早餐"],\n  "card_last_four": null,\n  "total": -120\n}\n```'
+)
+EXPECTED = json.loads(MODEL_OUTPUT[len("```json\n"):-len("\n```")])
+
+
+def _feed_all(chunks):
+    parser = IncrementalJSONObjectParser()
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return parser, completed
+
+
+def test_every_split_point():
+    """在任意位置切成两段，结果都与一次性解析一致"""
+    for i in range(len(MODEL_OUTPUT) + 1):
+        parser, completed = _feed_all([MODEL_OUTPUT[:i], MODEL_OUTPUT[i:]])
+        assert parser.done, i
+        assert parser.result == EXPECTED, i
+        assert completed == list(EXPECTED.items()), i
+
+
+def test_small_chunks():
+    """按 1~5 个字符的块输入"""
+    for size in range(1, 6):
+        chunks = [MODEL_OUTPUT[i:i + size] for i in range(0, len(MODEL_OUTPUT), size)]
+        parser, completed = _feed_all(chunks)
+        assert parser.result == EXPECTED, size
+        assert completed == list(EXPECTED.items()), size
+
+
+def test_number_waits_for_delimiter():
+    """数字后面还没有 ',' 或 '}' 时不输出"""
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"amount": 25.') == []
+    assert parser.feed('5') == []
+    assert parser.feed('  ') == []
+    assert parser.feed(',') == [("amount", 25.5)]
+    assert parser.feed('"n": 1e') == []
+    assert parser.feed('3}') == [("n", 1000)]
+    assert parser.done
@@ -0,0 +1,136 @@
+"""测试账本缓存的增量追加"""
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from beancount import loader
+from app.config import settings
+from app.services.beancount_ops import BeancountService
+from beancount.core import data
+from app.services.ledger_cache import DerivedIndex, LedgerCache
+
+LEDGER = """option "operating_currency" "CNY"
+2026-01-01 open Assets:Alipay
+2026-01-01 open Expenses:Food
+include "transactions.beancount"
+"""
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    (tmp_path / "main.beancount").write_text(LEDGER, encoding="utf-8")
+    (tmp_path / "transactions.beancount").write_text(
+        '\n2026-01-10 * "a" "a"\n  Expenses:Food  10.00 CNY\n  Assets:Alipay  -10.00 CNY\n'
+        '\n2026-01-20 * "b" "b"\n  Expenses:Food  20.00 CNY\n  Assets:Alipay  -20.00 CNY\n',
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(settings, "BEANCOUNT_MAIN_PATH", str(tmp_path / "main.beancount"))
+    monkeypatch.setattr(settings, "BEANCOUNT_TRANSACTION_PATH", str(tmp_path / "transactions.beancount"))
+    LedgerCache.invalidate()
+    yield BeancountService()
+    LedgerCache.invalidate()
+
+
+def _append(service, date, amount, merchant):
+    service.write_transactions([service._format_transaction(
+        date, amount, merchant, "", "Assets:Alipay", "Expenses:Food"
+    )])
+
+
+def _key(entries):
+    return [(e.date, getattr(e, "payee", None) or "", type(e).__name__) for e in entries]
+
+
+def test_append_matches_full_parse(service):
+    """追加后不重新解析，合并得到的条目与整体排序的结果相同，也与完整解析的条目一一对应"""
+    base = LedgerCache.get()
+    _append(service, "2026-01-15", 15, "c")
+    _append(service, "2026-01-05", 5, "d")
+    _append(service, "2026-01-20", 21, "e")
+    snapshot = LedgerCache.get()
+    assert snapshot.base_version == base.base_version
+    assert snapshot.version == base.version + 3
+    assert snapshot.appended_count == 3
+    # 旧版本不受追加影响
+    assert len(base.entries) == len(base.base_entries)
+
+    expected = sorted(snapshot.base_entries + snapshot.appended_since(0), key=data.entry_sortkey)
+    assert [id(e) for e in snapshot.entries] == [id(e) for e in expected]
+
+    entries, errors, _ = loader.load_file(settings.BEANCOUNT_MAIN_PATH)
+    assert not errors
+    # 追加的交易没有真实行号，同一天内的顺序可能不同
+    assert sorted(_key(snapshot.entries)) == sorted(_key(entries))
+    assert [e.date for e in snapshot.entries] == [e.date for e in entries]
+
+
+class _CountingIndex(DerivedIndex):
+    """记录 rebuild/update 调用的派生索引"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self.transactions = 0
+
+    def rebuild(self, entries):
+        self.calls.append("rebuild")
+        self.transactions = sum(isinstance(e, data.Transaction) for e in entries)
+
+    def update(self, entries):
+        self.calls.append("update")
+        self.transactions += len(entries)
+
+
+def _external_write(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_external_edit_between_appends_forces_reparse(service):
+    """写入前文件已被外部修改时不做增量更新，下次读取完整重新解析，两边的交易都在"""
+    index = _CountingIndex()
+    index.refresh(LedgerCache.get())
+    _append(service, "2026-01-15", 15, "c")
+    index.refresh(LedgerCache.get())
+    assert index.calls == ["rebuild", "update"]
+
+    _external_write(settings.BEANCOUNT_TRANSACTION_PATH,
+                    '\n2026-01-16 * "ext" "ext"\n  Expenses:Food  1.00 CNY\n  Assets:Alipay  -1.00 CNY\n')
+    before = LedgerCache._snapshot
+    _append(service, "2026-01-17", 17, "d")
+    # 外部修改使写入前的状态与缓存不一致，缓存保持不变
+    assert LedgerCache._snapshot is before
+    snapshot = LedgerCache.get()
+    assert snapshot.base_version != before.base_version
+    assert snapshot.appended_count == 0
+    assert {"ext", "d"} <= {getattr(e, "payee", None) for e in snapshot.entries}
+
+    index.refresh(snapshot)
+    assert index.calls[-1] == "rebuild"
+    assert index.transactions == 5
+
+
+def test_external_edit_after_append_detected(service):
+    """增量更新后签名对应写入后的文件，随后的外部修改（包括 include 的主文件）仍能发现"""
+    LedgerCache.get()
+    _append(service, "2026-01-15", 15, "c")
+    assert LedgerCache.is_fresh()
+    assert LedgerCache._snapshot.appended_count == 1
+    _external_write(settings.BEANCOUNT_MAIN_PATH, "2026-01-02 open Expenses:Transport\n")
+    assert not LedgerCache.is_fresh()
+    snapshot = LedgerCache.get()
+    assert "Expenses:Transport" in snapshot.accounts
+    assert snapshot.appended_count == 0
+    assert "c" in {getattr(e, "payee", None) for e in snapshot.entries}
+
+
+def test_append_without_snapshot_is_ignored(service):
+    """尚未解析过账本时不记录追加，首次读取直接解析文件"""
+    _append(service, "2026-01-15", 15, "c")
+    assert LedgerCache._snapshot is None
+    snapshot = LedgerCache.get()
+    assert snapshot.appended_count == 0
+    assert "c" in {getattr(e, "payee", None) for e in snapshot.entries}
@@ -0,0 +1,49 @@
+"""测试解析结果缓存"""
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from app.config import settings
+from app.services.parse_cache import ParseCache
+from app.services.prompts import Prompt
+
+
+def test_image_key_ignores_date():
+    """图片的键不随日期变化，文本的键随日期变化"""
+    today, tomorrow = Prompt("rules", "2026-01-15"), Prompt("rules", "2026-01-16")
+    assert ParseCache.make_key("image", "d", today, "m") == ParseCache.make_key("image", "d", tomorrow, "m")
+    assert ParseCache.make_key("text", "d", today, "m") != ParseCache.make_key("text", "d", tomorrow, "m")
+    assert ParseCache.make_key("image", "d", today, "m") != ParseCache.make_key("image", "d", Prompt("v2", ""), "m")
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PARSE_CACHE_TTL", 60)
+    monkeypatch.setattr(settings, "PARSE_CACHE_SWEEP_INTERVAL", 3600)
+    monkeypatch.setattr(ParseCache, "_last_sweep", time.time())
+    ParseCache._entries.clear()
+    yield tmp_path
+    ParseCache._entries.clear()
+
+
+def test_expired_file_removed_on_read(disk_cache):
+    ParseCache._write_disk("ab" * 32, time.time() - 120, {"amount": 1})
+    path = ParseCache._disk_path("ab" * 32)
+    assert os.path.exists(path)
+    assert ParseCache.get("ab" * 32) is None
+    assert not os.path.exists(path)
+
+
+def test_sweep_removes_only_expired(disk_cache):
+    ParseCache.put("cd" * 32, {"amount": 1})
+    ParseCache._write_disk("ef" * 32, 0, {"amount": 2})
+    old = ParseCache._disk_path("ef" * 32)
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    assert ParseCache.sweep() == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(ParseCache._disk_path("cd" * 32))
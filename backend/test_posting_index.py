@@ -0,0 +1,109 @@
+"""测试交易查询索引的游标分页"""
+import sys
+import os
+from datetime import date
+from decimal import Decimal
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+from beancount import loader
+from app.services.posting_index import PostingIndex, TransactionQuery
+
+HEADER = """2026-01-01 open Assets:Alipay
+2026-01-01 open Assets:Bank:CCB
+2026-01-01 open Expenses:Food:Lunch
+2026-01-01 open Expenses:Transport
+"""
+
+
+def _transaction(day: str, payee: str, account: str, amount: str, payment: str = "Assets:Alipay") -> str:
+    return f'\n{day} * "{payee}" "{payee}"\n  {account}  {amount} CNY\n  {payment}  -{amount} CNY\n'
+
+
+TRANSACTIONS = [
+    _transaction("2026-01-03", "麦当劳", "Expenses:Food:Lunch", "25.00"),
+    _transaction("2026-01-03", "滴滴", "Expenses:Transport", "30.00", "Assets:Bank:CCB"),
+    # 内容完全相同的两笔交易
+    _transaction("2026-01-05", "面馆", "Expenses:Food:Lunch", "18.00"),
+    _transaction("2026-01-05", "面馆", "Expenses:Food:Lunch", "18.00"),
+    _transaction("2026-01-05", "星巴克", "Expenses:Food:Lunch", "45.00", "Assets:Bank:CCB"),
+    _transaction("2026-01-08", "地铁", "Expenses:Transport", "4.00"),
+    _transaction("2026-01-10", "麦当劳", "Expenses:Food:Lunch", "32.50"),
+]
+
+
+def _index(transactions) -> PostingIndex:
+    entries, errors, _ = loader.load_string(HEADER + "".join(transactions))
+    assert not errors
+    index = PostingIndex()
+    index.rebuild(entries)
+    return index
+
+
+def _pages(index: PostingIndex, limit: int, **conditions):
+    """按页读取全部结果，返回 [(交易 ID, 交易)]"""
+    results, cursor = [], None
+    while True:
+        page, cursor = index.search(TransactionQuery(cursor=cursor, limit=limit, **conditions))
+        results.extend(page)
+        if cursor is None:
+            return results
+
+
+def test_pages_cover_all_transactions_newest_first():
+    index = _index(TRANSACTIONS)
+    for limit in (1, 2, 3, 10):
+        results = _pages(index, limit)
+        assert len(results) == len(TRANSACTIONS)
+        assert len({id_ for id_, _ in results}) == len(TRANSACTIONS)
+        dates = [entry.date for _, entry in results]
+        assert dates == sorted(dates, reverse=True)
+
+
+def test_cursor_stable_across_rebuilds():
+    """文件中顺序和行号不同（如另一个 worker 或重新解析后），同一游标得到相同的下一页"""
+    first = _index(TRANSACTIONS)
+    second = _index(list(reversed(TRANSACTIONS)))
+    page, cursor = first.search(TransactionQuery(limit=3))
+    expected, _ = first.search(TransactionQuery(cursor=cursor, limit=3))
+    actual, _ = second.search(TransactionQuery(cursor=cursor, limit=3))
+    assert [id_ for id_, _ in actual] == [id_ for id_, _ in expected]
+    assert [id_ for id_, _ in _pages(first, 2)] == [id_ for id_, _ in _pages(second, 2)]
+
+
+def test_stale_cursor_rejected():
+    index = _index(TRANSACTIONS)
+    results = _pages(index, 10)
+    cursor = next(id_ for id_, entry in results if entry.payee == "地铁")
+    edited = [t for t in TRANSACTIONS if "地铁" not in t]
+    with pytest.raises(ValueError):
+        _index(edited).search(TransactionQuery(cursor=cursor))
+    with pytest.raises(ValueError):
+        index.search(TransactionQuery(cursor="not-a-cursor"))
+
+
+def test_update_keeps_existing_cursors():
+    """增量追加后原有游标仍然有效，新交易按日期出现在正确位置"""
+    entries, _, _ = loader.load_string(HEADER + "".join(TRANSACTIONS))
+    index = PostingIndex()
+    index.rebuild(entries)
+    page, cursor = index.search(TransactionQuery(limit=2))
+
+    appended, _, _ = loader.load_string(HEADER + _transaction("2026-01-04", "面馆", "Expenses:Food:Lunch", "18.00"))
+    index.update([entry for entry in appended if hasattr(entry, "postings")])
+    rest, _ = index.search(TransactionQuery(cursor=cursor, limit=100))
+    assert len(page) + len(rest) == len(TRANSACTIONS) + 1
+    assert [entry.date for _, entry in rest] == sorted((entry.date for _, entry in rest), reverse=True)
+
+
+def test_filters():
+    index = _index(TRANSACTIONS)
+    food = _pages(index, 2, account="Expenses:Food")
+    assert len(food) == 5
+    assert {entry.payee for _, entry in _pages(index, 2, payee="麦当劳")} == {"麦当劳"}
+    ccb = _pages(index, 1, account="Assets:Bank", start=date(2026, 1, 4))
+    assert [entry.payee for _, entry in ccb] == ["星巴克"]
+    large = _pages(index, 2, account="Expenses", min_amount=Decimal("30"))
+    assert sorted(entry.payee for _, entry in large) == ["星巴克", "滴滴", "麦当劳"]
@@ -58,6 +58,17 @@ export const parseImage = async (imageBase64) => {
   return response.data
 }
 
+// 以 multipart 直接上传图片文件，无需 base64 编码，返回与文件顺序一致的数组，
+// 每项为 { index, success, result, error }，单张失败不影响其他图片
+export const parseImageFiles = async (files) => {
+  const formData = new FormData()
+  for (const file of files) {
+    formData.append('files', file)
+  }
+  const response = await api.post('/parse/image/upload', formData)
+  return response.data
+}
+
 export const parseText = async (text) => {
   const response = await api.post('/parse/text', {
     text
@@ -65,6 +76,55 @@ export const parseText = async (text) => {
   return response.data
 }
 
+// 流式解析：通过 SSE 逐字段接收解析结果，每完成一个字段调用 onField(name, value)，最终返回完整结果
+const streamParse = async (path, body, onField) => {
+  const response = await fetch(`/api${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Authorization: `Bearer ${getToken()}`
+    },
+    body: JSON.stringify(body)
+  })
+  if (response.status === 401) {
+    removeToken()
+    window.location.href = '/login'
+    throw new Error('Unauthorized')
+  }
+  if (!response.ok) {
+    throw new Error(`HTTP ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+      const raw = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      const event = raw.match(/^event: (.*)$/m)?.[1]
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || 'null')
+      if (event === 'field') {
+        onField?.(data.name, data.value)
+      } else if (event === 'result') {
+        return data
+      } else if (event === 'error') {
+        throw new Error(data.detail)
+      }
+    }
+  }
+  throw new Error('Stream ended unexpectedly')
+}
+
+export const parseTextStream = (text, onField) => streamParse('/parse/text/stream', { text }, onField)
+
+export const parseImageStream = (imageBase64, onField) => streamParse('/parse/image/stream', { image: imageBase64 }, onField)
+
 export const saveTransaction = async (transaction) => {
   const response = await api.post('/transaction', transaction)
   return response.data